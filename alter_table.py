@@ -1,15 +1,23 @@
+import argparse
 import sqlite3
+from migrations import migrate
 
-def alter_invoices_table():
-    conn = sqlite3.connect('invoices.db')
-    c = conn.cursor()
+def alter_invoices_table(db_path='invoices.db'):
+    conn = sqlite3.connect(db_path)
 
-    # Add new columns
-    c.execute("ALTER TABLE invoices ADD COLUMN paid_amount REAL DEFAULT 0")
-    c.execute("ALTER TABLE invoices ADD COLUMN remaining_amount REAL DEFAULT 0")
-    c.execute("ALTER TABLE invoices ADD COLUMN paid_status TEXT DEFAULT 'Unpaid'")
+    # Applies whatever migrations this database is missing, so running it
+    # more than once is harmless
+    version = migrate(conn)
+    print(f"{db_path} is at schema version {version}")
 
-    conn.commit()
     conn.close()
 
-alter_invoices_table()
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bring invoices.db up to the current schema.')
+    parser.add_argument('--db', default='invoices.db', help='path to invoices.db')
+    args = parser.parse_args(argv)
+    alter_invoices_table(args.db)
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
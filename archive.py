@@ -0,0 +1,237 @@
+"""Move old, fully paid invoices out of invoices.db into per-year archive files.
+
+An archived invoice, its items and its payments live in
+``archive/invoices_<year>.db`` next to invoices.db, and archived_invoices
+remembers which year each one went to. Archive files are attached with
+ATTACH DATABASE only when something asks for archived data:
+db.fetch_invoice falls back to them, so re-rendering a PDF works as before,
+and attach_archives() adds temporary all_invoices, all_invoice_items and
+all_payments views that search and the viewer read when archived invoices
+are included.
+
+Reports keep counting archived invoices and search keeps their index
+entries: the delete triggers behind both skip rows while archiving runs.
+"""
+import argparse
+import os
+import re
+import sqlite3
+from datetime import date, timedelta
+
+import db
+from db import DB_PATH
+
+ARCHIVE_AFTER_DAYS = 730
+TABLES = ('invoices', 'invoice_items', 'payments')
+ARCHIVE_FILE = re.compile(r'^invoices_(\d{4})\.db$')
+
+# Closed invoices: nothing left to pay, dated before the cutoff. Dates are
+# ISO, so each year is a range on the date index.
+CANDIDATES = """SELECT invoice_id FROM main.invoices
+                WHERE date >= :year_start AND date < :year_end AND date < :cutoff AND remaining_cents = 0"""
+
+
+def archive_dir(conn):
+    if os.environ.get('INVOICES_ARCHIVE_DIR'):
+        return os.environ['INVOICES_ARCHIVE_DIR']
+    main_file = next(row[2] for row in conn.execute("PRAGMA database_list") if row[1] == 'main')
+    return os.path.join(os.path.dirname(main_file) or '.', 'archive')
+
+
+def archive_years(conn):
+    """Years that have an archive file, oldest first."""
+    try:
+        names = os.listdir(archive_dir(conn))
+    except FileNotFoundError:
+        return []
+    return sorted(match.group(1) for match in map(ARCHIVE_FILE.match, names) if match)
+
+
+def _columns(conn, table, schema='main'):
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def _prepare_schema(conn, schema):
+    # Tables and indexes are copied from the hot database, and columns it
+    # gained since the archive file was made are added, so archived rows
+    # always have the same columns as live ones
+    def definitions(type_):
+        return conn.execute("""SELECT sql FROM main.sqlite_master
+                               WHERE tbl_name IN ('invoices', 'invoice_items', 'payments')
+                               AND type = ? AND sql IS NOT NULL""", (type_,)).fetchall()
+
+    for sql, in definitions('table'):
+        conn.execute(re.sub(r'^CREATE TABLE (\w+)', rf'CREATE TABLE IF NOT EXISTS {schema}.\1', sql))
+    for table in TABLES:
+        existing = set(_columns(conn, table, schema))
+        for _, name, type_, _, default, _ in conn.execute(f"PRAGMA main.table_info({table})").fetchall():
+            if name not in existing:
+                default = f" DEFAULT {default}" if default is not None else ''
+                conn.execute(f"ALTER TABLE {schema}.{table} ADD COLUMN {name} {type_}{default}")
+    # Indexes last: one may be on a column the archive only just gained
+    for sql, in definitions('index'):
+        conn.execute(re.sub(r'^CREATE INDEX (\w+)', rf'CREATE INDEX IF NOT EXISTS {schema}.\1', sql))
+
+
+def _max_attached(conn):
+    # Connection.getlimit is new in Python 3.11; 10 is SQLite's default
+    getlimit = getattr(conn, 'getlimit', None)
+    return getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) if getlimit else 10
+
+
+def _attached_archives(conn):
+    return [row[1] for row in conn.execute("PRAGMA database_list") if row[1].startswith('archive_')]
+
+
+def attach(year, conn=None, create=False):
+    """Attach the archive for ``year`` to ``conn`` and return its schema name.
+
+    Must be called outside a transaction, which ATTACH requires; raises
+    sqlite3.ProgrammingError inside one rather than committing the caller's
+    work. Raises LookupError when there is no archive for the year and
+    ``create`` is false. When the connection already has as many databases
+    attached as SQLite allows, the first attached archive is detached.
+    """
+    conn = conn or db.get_connection()
+    schema = f"archive_{year}"
+    attached = _attached_archives(conn)
+    if schema in attached:
+        return schema
+    path = os.path.join(archive_dir(conn), f"invoices_{year}.db")
+    if not create and not os.path.exists(path):
+        raise LookupError(f'No archive for {year}')
+    if conn.in_transaction:
+        raise sqlite3.ProgrammingError('Archives cannot be attached inside an open transaction')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if len(attached) >= _max_attached(conn):
+        # The all_* views may read the archive going away; attach_archives
+        # rebuilds them when they are next needed
+        for table in TABLES:
+            conn.execute(f"DROP VIEW IF EXISTS temp.all_{table}")
+        conn.execute(f"DETACH DATABASE {attached[0]}")
+    conn.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+    with conn:
+        _prepare_schema(conn, schema)
+    return schema
+
+
+def attach_archives(conn=None):
+    """Attach every archive and point the all_* views at them; returns the schema names.
+
+    Raises ValueError when there are more archive years than SQLite can
+    attach to one connection.
+    """
+    conn = conn or db.get_connection()
+    years = archive_years(conn)
+    if len(years) > _max_attached(conn):
+        raise ValueError(f'{len(years)} archive years are more than the {_max_attached(conn)} '
+                         f'databases SQLite can attach at once')
+    schemas = [attach(year, conn) for year in years]
+    for table in TABLES:
+        columns = ', '.join(_columns(conn, table))
+        sql = f"CREATE VIEW all_{table} AS " + " UNION ALL ".join(
+            f"SELECT {columns} FROM {schema}.{table}" for schema in ['main', *schemas])
+        current = conn.execute("SELECT sql FROM temp.sqlite_master WHERE name = ?", (f"all_{table}",)).fetchone()
+        # Views are only rebuilt when an archive appears, since DDL throws
+        # away the connection's prepared statements
+        if current is None or current[0] != sql.replace('CREATE VIEW', 'CREATE TEMP VIEW', 1):
+            conn.execute(f"DROP VIEW IF EXISTS temp.all_{table}")
+            conn.execute(sql.replace('CREATE VIEW', 'CREATE TEMP VIEW', 1))
+    return schemas
+
+
+def fetch_archived(invoice_id, conn=None):
+    """Like db.fetch_invoice, for an invoice that has been archived."""
+    conn = conn or db.get_connection()
+    row = conn.execute("SELECT year FROM archived_invoices WHERE invoice_id = ?", (invoice_id,)).fetchone()
+    if row is None:
+        raise LookupError(f'Invoice {invoice_id} does not exist')
+    schema = attach(row[0], conn)
+    invoice = conn.execute(f"SELECT {', '.join(_columns(conn, 'invoices'))} FROM {schema}.invoices WHERE invoice_id = ?",
+                           (invoice_id,)).fetchone()
+    if invoice is None:
+        raise LookupError(f'Invoice {invoice_id} is missing from the {row[0]} archive')
+    items = conn.execute(f"SELECT {', '.join(_columns(conn, 'invoice_items'))} FROM {schema}.invoice_items "
+                         f"WHERE invoice_id = ?", (invoice_id,)).fetchall()
+    return invoice, items
+
+
+def candidate_years(cutoff, conn=None):
+    """``{year: invoice count}`` of invoices archive_invoices(cutoff) would move."""
+    conn = conn or db.get_connection()
+    return dict(conn.execute("""SELECT substr(date, 1, 4), COUNT(*) FROM main.invoices
+                                WHERE date < :cutoff AND date GLOB '[0-9][0-9][0-9][0-9]-*' AND remaining_cents = 0
+                                GROUP BY 1""", {'cutoff': cutoff}))
+
+
+def archive_year(year, cutoff, conn=None):
+    """Move the closed invoices of ``year`` dated before ``cutoff`` into its archive; returns how many.
+
+    The main database is in WAL mode, so the commit is atomic per file but
+    not across both. Rows are copied with INSERT OR REPLACE before they are
+    deleted, so running again after a crash finishes a half-done move.
+    """
+    conn = conn or db.get_connection()
+    schema = attach(year, conn, create=True)
+    params = {'year_start': f"{year}-01-01", 'year_end': f"{int(year) + 1}-01-01", 'cutoff': cutoff}
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("INSERT INTO archiving VALUES (1)")
+        conn.execute("CREATE TEMP TABLE archive_moving (invoice_id INTEGER PRIMARY KEY)")
+        count = conn.execute(f"INSERT INTO temp.archive_moving {CANDIDATES}", params).rowcount
+        moving = "invoice_id IN (SELECT invoice_id FROM temp.archive_moving)"
+        for table in TABLES:
+            columns = ', '.join(_columns(conn, table))
+            conn.execute(f"INSERT OR REPLACE INTO {schema}.{table} ({columns}) "
+                         f"SELECT {columns} FROM main.{table} WHERE {moving}")
+        conn.execute("INSERT OR REPLACE INTO archived_invoices (invoice_id, year) "
+                     "SELECT invoice_id, ? FROM temp.archive_moving", (year,))
+        for table in reversed(TABLES):
+            conn.execute(f"DELETE FROM main.{table} WHERE {moving}")
+        conn.execute("DROP TABLE temp.archive_moving")
+        conn.execute("DELETE FROM archiving")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return count
+
+
+def archive_invoices(cutoff, conn=None, progress=None):
+    """Archive every closed invoice dated before ``cutoff`` (YYYY-MM-DD); returns ``{year: count}``."""
+    conn = conn or db.get_connection()
+    moved = {}
+    for year in sorted(candidate_years(cutoff, conn)):
+        moved[year] = archive_year(year, cutoff, conn)
+        if progress:
+            progress(year, moved[year])
+    return moved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Move old, fully paid invoices into per-year archive databases.')
+    parser.add_argument('--older-than-days', type=int, default=ARCHIVE_AFTER_DAYS,
+                        help=f'archive invoices dated more than this many days ago (default {ARCHIVE_AFTER_DAYS})')
+    parser.add_argument('--before', help='archive invoices dated before this YYYY-MM-DD instead')
+    parser.add_argument('--dry-run', action='store_true', help='only show how many invoices would move')
+    parser.add_argument('--vacuum', action='store_true', help='shrink invoices.db afterwards (rewrites the file)')
+    parser.add_argument('--db', default=DB_PATH, help='path to invoices.db')
+    args = parser.parse_args(argv)
+
+    conn = db.get_connection(args.db)
+    cutoff = args.before or (date.today() - timedelta(days=args.older_than_days)).isoformat()
+    if args.dry_run:
+        for year, count in sorted(candidate_years(cutoff, conn).items()):
+            print(f"{year}: {count} invoices")
+        return 0
+
+    moved = archive_invoices(cutoff, conn, lambda year, count: print(f"{year}: archived {count} invoices"))
+    if not moved:
+        print(f"No closed invoices dated before {cutoff}")
+    elif args.vacuum:
+        conn.execute("VACUUM main")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,158 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import archive
+import db
+from db import DB_PATH
+from render import DUPLICATE_DIR, render_invoice
+
+# Per-process state, set up once by _init_worker so every chunk reuses it
+_worker_conn = None
+_worker_out_dir = DUPLICATE_DIR
+
+
+class BatchReport:
+    def __init__(self):
+        self.rendered = []
+        self.failures = {}
+        self.elapsed = 0.0
+
+    @property
+    def total(self):
+        return len(self.rendered) + len(self.failures)
+
+    @property
+    def throughput(self):
+        # Invoices per second, failed ones included since they cost time too
+        return self.total / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        return (f"Rendered {len(self.rendered)}/{self.total} invoices in {self.elapsed:.2f}s "
+                f"({self.throughput:.1f} invoices/s), {len(self.failures)} failed")
+
+
+def select_invoice_ids(db_path=DB_PATH, ids=None, start=None, end=None, where=None, params=(), archived=False):
+    """Resolve an explicit id list, an inclusive id range or a WHERE clause to invoice ids.
+
+    Archived invoices are left out unless ``archived`` is set.
+    """
+    if ids is not None:
+        return list(ids)
+
+    clauses = []
+    args = []
+    if start is not None:
+        clauses.append("invoice_id >= ?")
+        args.append(start)
+    if end is not None:
+        clauses.append("invoice_id <= ?")
+        args.append(end)
+    if where:
+        clauses.append(f"({where})")
+        args.extend(params)
+
+    conn = db.get_connection(db_path)
+    table = 'invoices'
+    if archived:
+        # Rendering finds archived invoices through db.fetch_invoice
+        archive.attach_archives(conn)
+        table = 'all_invoices'
+    query = f"SELECT invoice_id FROM {table} AS invoices"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    query += " ORDER BY invoice_id"
+
+    return [row[0] for row in conn.execute(query, args)]
+
+
+def _init_worker(db_path, out_dir):
+    global _worker_conn, _worker_out_dir
+    _worker_conn = db.connect(db_path)
+    _worker_out_dir = out_dir
+
+
+def _render_chunk(invoice_ids):
+    results = []
+    for invoice_id in invoice_ids:
+        try:
+            results.append((invoice_id, render_invoice(invoice_id, _worker_out_dir, conn=_worker_conn), None))
+        except Exception as e:
+            results.append((invoice_id, None, f"{type(e).__name__}: {e}"))
+    return results
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def render_batch(invoice_ids, out_dir=DUPLICATE_DIR, db_path=DB_PATH, workers=None, chunksize=None, progress=None):
+    """Render many invoices across a process pool.
+
+    ``progress`` is called as ``progress(done, total)`` after each chunk.
+    A failing invoice is recorded in the report and never stops the batch.
+    """
+    invoice_ids = list(invoice_ids)
+    workers = workers or os.cpu_count() or 1
+    # A handful of chunks per worker keeps the pool busy without paying
+    # inter-process overhead for every single invoice
+    chunksize = chunksize or max(1, min(50, len(invoice_ids) // (workers * 4) or 1))
+
+    report = BatchReport()
+    os.makedirs(out_dir, exist_ok=True)
+    started = time.perf_counter()
+
+    def collect(results):
+        for invoice_id, path, error in results:
+            if error is None:
+                report.rendered.append(path)
+            else:
+                report.failures[invoice_id] = error
+        if progress:
+            progress(report.total, len(invoice_ids))
+
+    if workers == 1 or len(invoice_ids) <= chunksize:
+        _init_worker(db_path, out_dir)
+        try:
+            for chunk in _chunks(invoice_ids, chunksize):
+                collect(_render_chunk(chunk))
+        finally:
+            _worker_conn.close()
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(db_path, out_dir)) as executor:
+            futures = [executor.submit(_render_chunk, chunk) for chunk in _chunks(invoice_ids, chunksize)]
+            for future in as_completed(futures):
+                collect(future.result())
+
+    report.elapsed = time.perf_counter() - started
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Re-issue invoice PDFs without the GUI.')
+    parser.add_argument('ids', nargs='*', type=int, help='invoice ids to render')
+    parser.add_argument('--from', dest='start', type=int, help='first invoice id of a range')
+    parser.add_argument('--to', dest='end', type=int, help='last invoice id of a range')
+    parser.add_argument('--where', help="SQL condition on invoices, e.g. \"paid_status = 'Not Paid'\"")
+    parser.add_argument('--include-archived', action='store_true',
+                        help='also render invoices moved to the yearly archives, which are left out by default')
+    parser.add_argument('--out', default=DUPLICATE_DIR, help='output directory')
+    parser.add_argument('--db', default=DB_PATH, help='path to invoices.db')
+    parser.add_argument('--workers', type=int, help='number of processes (default: CPU count)')
+    args = parser.parse_args(argv)
+
+    invoice_ids = select_invoice_ids(args.db, ids=args.ids or None, start=args.start, end=args.end, where=args.where,
+                                     archived=args.include_archived)
+    report = render_batch(invoice_ids, args.out, args.db, workers=args.workers)
+
+    print(report.summary())
+    for invoice_id, error in sorted(report.failures.items()):
+        print(f"  invoice {invoice_id}: {error}")
+    return 1 if report.failures else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,295 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import db
+from bulk_import import _write_chunk
+from custom import CustomPDF
+from line_items import LineItems
+
+# Invoice counts per dataset scale
+SCALES = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+
+# Items per invoice: (weight, low, high). Most invoices are short and a
+# few are huge, which is what makes the layout paths interesting.
+ITEM_COUNTS = ((70, 1, 5), (25, 6, 50), (4.9, 51, 300), (0.1, 301, 2000))
+
+NAMES = ('Photography', 'Videography', 'Drone coverage', 'Wedding album', 'Highlights reel',
+         'Pre-wedding shoot', 'Photo booth', 'Extra hour', 'Printed canvas', 'Raw footage')
+DESCRIPTIONS = ('', 'Full day', 'Two cameras', 'Delivered within 15 days of the event',
+                'Includes editing and colour grading of every selected picture')
+VENUES = ('Marquee Hall', 'Pearl Continental', 'Garden Lawn', 'Royal Palm', 'Beach Hut')
+FIRST_NAMES = ('Ali', 'Sara', 'Ahmed', 'Fatima', 'Usman', 'Ayesha', 'Bilal', 'Zara')
+LAST_NAMES = ('Khan', 'Malik', 'Sheikh', 'Qureshi', 'Butt', 'Raza')
+
+GENERATE_CHUNK = 2000
+
+
+def _item_count(rng, max_items):
+    _, low, high = rng.choices(ITEM_COUNTS, weights=[weight for weight, _, _ in ITEM_COUNTS])[0]
+    return min(rng.randint(low, high), max_items)
+
+
+def synthetic_invoice(rng, max_items=2000):
+    """One random ``(invoice, item_rows)`` as bulk_import writes them."""
+    items = LineItems()
+    for _ in range(_item_count(rng, max_items)):
+        items.add(rng.choice(NAMES), rng.choice(DESCRIPTIONS), rng.randrange(500, 50000, 50), rng.randint(1, 4))
+    items.paid_cents = rng.choice((0, items.total_cents // 2, items.total_cents))
+
+    day = date(2022, 1, 1) + timedelta(days=rng.randrange(1000))
+    customer = rng.randrange(5000)
+    invoice = (day.isoformat(), rng.choice(VENUES),
+               f"{FIRST_NAMES[customer % len(FIRST_NAMES)]} {LAST_NAMES[customer % len(LAST_NAMES)]}",
+               f"0300{customer:07d}",
+               items.total_cents / 100, items.paid_cents / 100, items.remaining_cents / 100, items.paid_status)
+    return invoice, items.rows()
+
+
+def generate_db(path, invoices, max_items=2000, seed=1):
+    """Create ``path`` with ``invoices`` synthetic invoices; the same seed gives the same data."""
+    if os.path.exists(path):
+        os.remove(path)
+    rng = random.Random(seed)
+    conn = db.connect(path)
+    try:
+        done = 0
+        while done < invoices:
+            chunk = [synthetic_invoice(rng, max_items) for _ in range(min(GENERATE_CHUNK, invoices - done))]
+            done += len(chunk)
+            _write_chunk(conn, 'benchmark', done, chunk)
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+
+def dataset(scale, data_dir, max_items=2000, seed=1):
+    """Path of the dataset for ``scale``, generated on first use and reused afterwards."""
+    path = os.path.join(data_dir, f"bench_{scale}_{max_items}_{seed}.db")
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        print(f"Generating {SCALES[scale]} invoices into {path}...", file=sys.stderr)
+        generate_db(path + '.tmp', SCALES[scale], max_items, seed)
+        os.replace(path + '.tmp', path)
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(path + '.tmp' + suffix):
+                os.remove(path + '.tmp' + suffix)
+    return path
+
+
+def measure(fn, repeat=20, min_time=0.2):
+    """Call ``fn()`` ``repeat`` times, or until ``min_time`` has passed; times in ms."""
+    times = []
+    started = time.perf_counter()
+    while len(times) < repeat or time.perf_counter() - started < min_time:
+        t = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t) * 1000)
+        if len(times) >= repeat * 50:
+            break
+    times.sort()
+    return {
+        'runs': len(times),
+        'min_ms': round(times[0], 4),
+        'median_ms': round(statistics.median(times), 4),
+        'mean_ms': round(statistics.fmean(times), 4),
+        'p95_ms': round(times[int(len(times) * 0.95) - 1 if len(times) > 1 else 0], 4),
+        'max_ms': round(times[-1], 4),
+    }
+
+
+def _invoice_with_items(conn, low, high=None):
+    query = """SELECT invoice_id FROM invoice_items GROUP BY invoice_id
+               HAVING COUNT(*) >= ? AND COUNT(*) <= ? ORDER BY invoice_id LIMIT 1"""
+    row = conn.execute(query, (low, high or 1 << 30)).fetchone()
+    return row[0] if row else None
+
+
+def bench_save(conn, rng):
+    # The insert half of InvoiceGenerator.save_and_generate_pdf. Every insert
+    # is rolled back so the cached dataset stays as generated and runs stay
+    # comparable; the commit itself is not timed.
+    invoice, items = synthetic_invoice(rng, 20)
+
+    def save():
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            return db.add_invoice(conn, invoice, items)
+        finally:
+            conn.rollback()
+    return save
+
+
+def bench_viewer_first_page(conn, rng):
+    from main import InvoiceTableModel
+
+    # What InvoiceViewer.load_invoices does, plus the cell text of one screenful
+    def load():
+        model = InvoiceTableModel()
+        model.fetchMore()
+        for row in range(min(40, model.rowCount())):
+            for column in range(model.columnCount()):
+                model.data(model.index(row, column))
+        return model
+    return load
+
+
+def bench_page_query(conn, rng):
+    last = conn.execute("SELECT MAX(invoice_id) FROM invoices").fetchone()[0]
+    return lambda: db.fetch_invoice_page(rng.randrange(last), 256, conn)
+
+
+def bench_item_query(conn, rng):
+    last = conn.execute("SELECT MAX(invoice_id) FROM invoices").fetchone()[0]
+    return lambda: conn.execute(db.SELECT_ITEMS, (rng.randrange(1, last + 1),)).fetchall()
+
+
+def bench_multi_cell_row(conn, rng):
+    pdf = CustomPDF()
+    pdf.add_page()
+    pdf.set_font("Helvetica", size=11)
+    row = ["Photography", "Includes editing and colour grading of every selected picture", "150.00", "2", "300.00"]
+
+    def draw():
+        pdf.set_xy(5, 20)
+        pdf.multi_cell_row(5, 40, 5, row)
+    return draw
+
+
+def _bench_table(rows):
+    def setup(conn, rng):
+        data = [(rng.choice(NAMES), rng.choice(DESCRIPTIONS), '150.00', '2', '300.00') for _ in range(rows)]
+
+        def draw():
+            pdf = CustomPDF()
+            pdf.add_page()
+            pdf.set_font("Helvetica", size=11)
+            pdf.table_rows([40] * 5, data, 5, header=["Item Name", "Description", "Price", "Quantity", "Total Price"])
+        return draw
+    return setup
+
+
+def _bench_render(low, high=None):
+    def setup(conn, rng):
+        from render import build_invoice_pdf
+
+        invoice_id = _invoice_with_items(conn, low, high)
+        if invoice_id is None:
+            return None
+        invoice, items = db.fetch_invoice(invoice_id, conn)
+        return lambda: build_invoice_pdf(invoice, items).output()
+    return setup
+
+
+# name -> setup(conn, rng) returning the callable to time, or None to skip.
+# Benchmarks that need Qt are skipped when PyQt5 is not installed.
+BENCHMARKS = {
+    'save.insert_invoice': bench_save,
+    'viewer.first_page': bench_viewer_first_page,
+    'viewer.page_query': bench_page_query,
+    'db.item_query': bench_item_query,
+    'pdf.multi_cell_row': bench_multi_cell_row,
+    'pdf.table_rows_100': _bench_table(100),
+    'pdf.table_rows_2000': _bench_table(2000),
+    'render.small_invoice': _bench_render(1, 5),
+    'render.large_invoice': _bench_render(300),
+}
+
+
+def run(db_path, names=None, repeat=20, seed=1):
+    """Time the selected benchmarks against ``db_path`` and return their results by name.
+
+    Nothing is written to the database: the save benchmark rolls back.
+    """
+    os.environ['INVOICES_DB'] = db_path
+    db.DB_PATH = db_path
+    conn = db.get_connection(db_path)
+    results = {}
+    for name in names or BENCHMARKS:
+        rng = random.Random(seed)
+        try:
+            fn = BENCHMARKS[name](conn, rng)
+        except ImportError as e:
+            results[name] = {'skipped': f"missing dependency: {e.name}"}
+            continue
+        if fn is None:
+            results[name] = {'skipped': 'dataset has no matching invoice'}
+            continue
+        fn()  # warm-up: caches, compiled layout, lazy imports
+        results[name] = measure(fn, repeat)
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(old, new):
+    """Lines comparing median times of two result files, slowest change first."""
+    lines = []
+    for name, result in new['results'].items():
+        before = old['results'].get(name, {}).get('median_ms')
+        after = result.get('median_ms')
+        if before and after:
+            lines.append((after / before, f"{name:28} {before:10.3f} -> {after:10.3f} ms  x{after / before:.2f}"))
+    return [line for _, line in sorted(lines, reverse=True)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time the database, layout and rendering hot paths.')
+    parser.add_argument('--scale', choices=SCALES, default='1k', help='synthetic dataset size')
+    parser.add_argument('--max-items', type=int, default=2000, help='largest number of items on one invoice')
+    parser.add_argument('--data-dir', default='benchmark_data', help='where generated datasets are kept')
+    parser.add_argument('--only', action='append', choices=BENCHMARKS, help='run just this benchmark (repeatable)')
+    parser.add_argument('--repeat', type=int, default=20, help='minimum timed runs per benchmark')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='earlier JSON results to compare against')
+    args = parser.parse_args(argv)
+
+    path = dataset(args.scale, args.data_dir, args.max_items, args.seed)
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    report = {
+        'meta': {
+            'scale': args.scale,
+            'invoices': SCALES[args.scale],
+            'max_items': args.max_items,
+            'seed': args.seed,
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'started': datetime.now().isoformat(timespec='seconds'),
+        },
+        'results': run(path, args.only, args.repeat, args.seed),
+    }
+
+    for name, result in report['results'].items():
+        if 'skipped' in result:
+            print(f"{name:28} skipped ({result['skipped']})")
+        else:
+            print(f"{name:28} median {result['median_ms']:10.3f} ms  p95 {result['p95_ms']:10.3f} ms  ({result['runs']} runs)")
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            print('\n'.join(compare(json.load(f), report)))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
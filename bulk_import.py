@@ -0,0 +1,219 @@
+import argparse
+import csv
+import json
+import os
+import time
+from datetime import datetime
+from itertools import groupby, islice
+
+import db
+import search
+from db import DB_PATH, INSERT_INVOICE_WITH_ID, INSERT_ITEM, UPSERT_CUSTOMER
+from line_items import LineItems, to_cents
+
+CHUNK_SIZE = 1000
+
+INVOICE_FIELDS = ('date', 'venue', 'customer_name', 'customer_phone')
+
+
+class ImportReport:
+    def __init__(self):
+        self.invoices = 0
+        self.items = 0
+        self.skipped = 0
+        self.rejected = []
+        self.elapsed = 0.0
+
+    @property
+    def rate(self):
+        return self.invoices / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        return (f"Imported {self.invoices} invoices ({self.items} items) in {self.elapsed:.2f}s "
+                f"({self.rate:.0f} invoices/s), {len(self.rejected)} rejected, "
+                f"{self.skipped} records done by earlier runs")
+
+
+def read_jsonl(path, skip=0):
+    """One invoice per line, with its line items under "items".
+
+    Lines are yielded unparsed: import_file parses each one where a bad
+    line rejects only its own record.
+    """
+    with open(path, encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            # Records already imported are counted but never parsed
+            if skip:
+                skip -= 1
+                continue
+            yield line_no, line
+
+
+def read_csv(path, skip=0):
+    """One line item per row; consecutive rows sharing an invoice_ref form one invoice.
+
+    Columns: invoice_ref, date, venue, customer_name, customer_phone,
+    paid_amount, item_name, item_description, price, quantity.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = enumerate(csv.DictReader(f), 2)
+        groups = groupby(rows, key=lambda row: row[1].get('invoice_ref'))
+        for _, group in islice(groups, skip, None):
+            group = list(group)
+            line_no, first = group[0]
+            record = {field: first.get(field) for field in INVOICE_FIELDS}
+            record['paid_amount'] = first.get('paid_amount')
+            record['items'] = [{'name': row.get('item_name'),
+                                'description': row.get('item_description'),
+                                'price': row.get('price'),
+                                'quantity': row.get('quantity')} for _, row in group]
+            yield line_no, record
+
+
+READERS = {'.jsonl': read_jsonl, '.csv': read_csv}
+
+# Accepted input date formats; invoices.date is always stored as YYYY-MM-DD
+DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%Y', '%m/%d/%y')
+
+
+def to_iso_date(text):
+    text = str(text).strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date().isoformat()
+        except ValueError:
+            pass
+    raise ValueError(f'Invalid date: {text!r}')
+
+
+def _quantity(value):
+    # int() would quietly truncate a JSON 2.5
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError(f'quantity is not a whole number: {value!r}')
+    return int(value)
+
+
+def validate(record):
+    """Return ``(invoice, items)`` ready for insertion, or raise ValueError."""
+    if not isinstance(record, dict):
+        raise ValueError('record is not an object')
+    for field in INVOICE_FIELDS:
+        if not str(record.get(field) or '').strip():
+            raise ValueError(f'missing {field}')
+    if not record.get('items'):
+        raise ValueError('invoice has no items')
+    if not isinstance(record['items'], list) or not all(isinstance(item, dict) for item in record['items']):
+        raise ValueError('items must be a list of objects')
+
+    items = LineItems()
+    for item in record['items']:
+        if not str(item.get('name') or '').strip():
+            raise ValueError('item without a name')
+        items.add(item['name'], item.get('description') or '', to_cents(item['price']), _quantity(item['quantity']))
+    items.paid_cents = to_cents(record.get('paid_amount') or 0)
+
+    invoice = (to_iso_date(record['date']), *(str(record[field]).strip() for field in INVOICE_FIELDS[1:]),
+               items.total_cents / 100, items.paid_cents / 100, items.remaining_cents / 100, items.paid_status)
+    return invoice, items.rows()
+
+
+def _next_invoice_id(conn):
+    # Only valid inside the write transaction: ids are handed out up front so
+    # invoices and items can both go in with executemany
+    return conn.execute("""SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'invoices'), 0),
+                                      COALESCE((SELECT MAX(invoice_id) FROM invoices), 0)) + 1""").fetchone()[0]
+
+
+def _write_chunk(conn, source, records_done, chunk):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        first_id = invoice_id = _next_invoice_id(conn)
+        invoice_rows = []
+        item_rows = []
+        for invoice, items in chunk:
+            invoice_rows.append((invoice_id, *invoice))
+            item_rows.extend((invoice_id, *item) for item in items)
+            invoice_id += 1
+
+        conn.executemany(UPSERT_CUSTOMER, [invoice[2:4] for invoice, _ in chunk])
+        with db.suspended_triggers(conn, search.INSERT_TRIGGERS):
+            conn.executemany(INSERT_INVOICE_WITH_ID, invoice_rows)
+            conn.executemany(INSERT_ITEM, item_rows)
+            search.index_invoice_range(first_id, invoice_id - 1, conn)
+        conn.execute("""INSERT INTO import_checkpoints (source, records_done, updated_at) VALUES (?, ?, ?)
+                        ON CONFLICT(source) DO UPDATE SET records_done = excluded.records_done,
+                                                          updated_at = excluded.updated_at""",
+                     (source, records_done, datetime.now().isoformat(timespec='seconds')))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(item_rows)
+
+
+def import_file(path, source=None, chunk_size=CHUNK_SIZE, db_path=DB_PATH, progress=None):
+    """Stream invoices from a .csv or .jsonl file into the database.
+
+    Each chunk of ``chunk_size`` records is committed together with the
+    import checkpoint for ``source`` (the absolute path by default), so after
+    a failure the same call resumes right after the last committed chunk.
+    Invalid records are skipped and listed in the report.
+    """
+    reader = READERS.get(os.path.splitext(path)[1].lower())
+    if reader is None:
+        raise ValueError(f'Unsupported import format: {path}')
+    source = source or os.path.abspath(path)
+
+    conn = db.get_connection(db_path)
+    row = conn.execute("SELECT records_done FROM import_checkpoints WHERE source = ?", (source,)).fetchone()
+    records_done = row[0] if row else 0
+
+    report = ImportReport()
+    report.skipped = records_done
+    started = time.perf_counter()
+
+    records = reader(path, skip=records_done)
+    while True:
+        batch = list(islice(records, chunk_size))
+        if not batch:
+            break
+
+        chunk = []
+        for line_no, record in batch:
+            try:
+                if isinstance(record, str):
+                    record = json.loads(record)
+                chunk.append(validate(record))
+            except (KeyError, TypeError, ValueError) as e:
+                report.rejected.append((line_no, str(e)))
+
+        records_done += len(batch)
+        report.items += _write_chunk(conn, source, records_done, chunk)
+        report.invoices += len(chunk)
+        if progress:
+            progress(report)
+
+    report.elapsed = time.perf_counter() - started
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk import invoices from CSV or JSONL.')
+    parser.add_argument('path', help='.csv or .jsonl file to import')
+    parser.add_argument('--source', help='checkpoint name (default: absolute path of the file)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='invoices per transaction')
+    parser.add_argument('--db', default=DB_PATH, help='path to invoices.db')
+    args = parser.parse_args(argv)
+
+    report = import_file(args.path, args.source, args.chunk_size, args.db)
+
+    print(report.summary())
+    for line_no, reason in report.rejected:
+        print(f"  line {line_no}: {reason}")
+    return 1 if report.rejected else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,64 @@
+"""Item names staff have invoiced before, for suggestions in the Add Item panel.
+
+The item_catalog table keeps each name's latest description and price; a
+trigger on invoice_items updates it whenever an invoice is saved, from any
+window, writer or import. ItemCatalog holds the names sorted in memory, so
+a suggestion is a binary search rather than a query, and refresh() reads
+only the catalog rows changed since it last ran. refresh() may run on a
+background thread while suggest() runs on another: it builds a new list
+and swaps it in, so suggest() never sees one half-updated.
+"""
+import bisect
+
+import db
+
+SUGGESTION_LIMIT = 20
+SELECT_CHANGED = """SELECT name, description, price_cents, version FROM item_catalog
+                    WHERE version > ? ORDER BY version"""
+
+
+class ItemCatalog:
+    def __init__(self):
+        # ((casefolded name, name), (name, description, price_cents)),
+        # sorted by the first element
+        self.items = []
+        self.version = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def refresh(self, conn=None):
+        """Pick up catalog rows added or changed since the last refresh; returns how many."""
+        conn = conn or db.get_connection()
+        rows = conn.execute(SELECT_CHANGED, (self.version,)).fetchall()
+        if not rows:
+            return 0
+        if not self.items:
+            # First load: one sort instead of an insort per name
+            items = sorted(((name.casefold(), name), (name, description, price_cents))
+                           for name, description, price_cents, _ in rows)
+        else:
+            items = list(self.items)
+            for name, description, price_cents, _ in rows:
+                item = ((name.casefold(), name), (name, description, price_cents))
+                i = bisect.bisect_left(items, (item[0],))
+                if i < len(items) and items[i][0] == item[0]:
+                    items[i] = item
+                else:
+                    items.insert(i, item)
+        self.items = items
+        self.version = rows[-1][3]
+        return len(rows)
+
+    def suggest(self, text, limit=SUGGESTION_LIMIT):
+        """``(name, description, price_cents)`` of up to ``limit`` items whose name starts with ``text``, in name order."""
+        prefix = text.strip().casefold()
+        if not prefix:
+            return []
+        items = self.items
+        i = bisect.bisect_left(items, ((prefix,),))
+        matches = []
+        while i < len(items) and len(matches) < limit and items[i][0][0].startswith(prefix):
+            matches.append(items[i][1])
+            i += 1
+        return matches
@@ -0,0 +1,42 @@
+"""Headless entry point: ``python -m cli <command> [options]``.
+
+Only the module behind the chosen command is imported, and none of them
+import Qt, so a command starts in a fraction of the time the GUI takes.
+"""
+import importlib
+import sys
+
+# command -> (module with a main(argv), description)
+COMMANDS = {
+    'render': ('batch_render', 'Re-issue invoice PDFs by id, id range or condition'),
+    'export': ('export', 'Export many invoices as one ZIP of PDFs or one merged PDF'),
+    'import': ('bulk_import', 'Bulk import invoices from CSV or JSONL'),
+    'archive': ('archive', 'Move old, fully paid invoices into per-year archive databases'),
+    'migrate': ('alter_table', 'Bring invoices.db up to the current schema'),
+    'serve': ('service', 'Serve invoice PDFs to local programs over HTTP'),
+    'writer': ('writer', 'Apply invoice and payment writes for other app instances'),
+}
+
+
+def usage():
+    lines = ['usage: python -m cli <command> [options]', '', 'commands:']
+    lines += [f"  {name:10} {description}" for name, (_, description) in COMMANDS.items()]
+    lines += ['', "Run 'python -m cli <command> --help' for a command's options."]
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage())
+        return 0
+    if argv[0] not in COMMANDS:
+        print(f"Unknown command {argv[0]!r}\n\n{usage()}", file=sys.stderr)
+        return 2
+
+    module = importlib.import_module(COMMANDS[argv[0]][0])
+    return module.main(argv[1:])
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
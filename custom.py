@@ -1,36 +1,188 @@
+import threading
+from collections import OrderedDict
+
 from fpdf import FPDF
 
+import metrics
+
 class CustomPDF(FPDF):
+    # Measured text is shared by every CustomPDF in the process, since the
+    # same labels, headers and item names come back invoice after invoice
+    TEXT_CACHE_SIZE = 4096
+    _text_cache = OrderedDict()
+    _text_cache_lock = threading.Lock()
+    text_cache_hits = 0
+    text_cache_misses = 0
+
     # def set_fill_color(self, r, g, b):
     #     super().set_fill_color(r, g, b)
         
-    def multi_cell_row(self, cells, width, height, data, to_fill=False):
-        # print(f"to_fill parameter value: {to_fill}")  # Print the value of to_fill
-        filling = to_fill
-        # print(f"Initial filling value: {filling}")
+    @classmethod
+    def text_cache_info(cls):
+        return {'hits': cls.text_cache_hits, 'misses': cls.text_cache_misses,
+                'size': len(cls._text_cache), 'max_size': cls.TEXT_CACHE_SIZE}
+
+    @classmethod
+    def clear_text_cache(cls):
+        with cls._text_cache_lock:
+            cls._text_cache.clear()
+            cls.text_cache_hits = cls.text_cache_misses = 0
+
+    def measure_text(self, width, text):
+        """``(string width, wrapped lines)`` of ``text`` in a ``width`` wide cell in the current font."""
+        text = str(text)
+        key = (self.font_family, self.font_style, self.font_size_pt, width, text)
+        cls = CustomPDF
+        with cls._text_cache_lock:
+            entry = cls._text_cache.get(key)
+            if entry is not None:
+                cls._text_cache.move_to_end(key)
+                cls.text_cache_hits += 1
+                return entry
+            cls.text_cache_misses += 1
+
+        entry = (self.get_string_width(text), tuple(self._wrap_text(width, text)))
+        with cls._text_cache_lock:
+            cls._text_cache[key] = entry
+            if len(cls._text_cache) > cls.TEXT_CACHE_SIZE:
+                cls._text_cache.popitem(last=False)
+        return entry
 
-        if to_fill:
-            self.set_fill_color(238, 238, 238)  # Set the fill color here
-            # print(f"In condition: {filling}")
+    def wrap_text(self, width, text):
+        """Break ``text`` into the lines a ``width`` wide cell shows in the current font."""
+        return self.measure_text(width, text)[1]
 
+    def _wrap_text(self, width, text):
+        max_width = width - 2 * self.c_margin
+        space = self.get_string_width(' ')
+        lines = []
+        for paragraph in text.split('\n'):
+            line = []
+            line_width = 0
+            for word in paragraph.split(' '):
+                word_width = self.get_string_width(word)
+                if line and line_width + space + word_width <= max_width:
+                    line.append(word)
+                    line_width += space + word_width
+                    continue
+                if line:
+                    lines.append(' '.join(line))
+                # A word wider than the cell is broken between characters
+                while word_width > max_width and len(word) > 1:
+                    cut = len(word) - 1
+                    while cut > 1 and self.get_string_width(word[:cut]) > max_width:
+                        cut -= 1
+                    lines.append(word[:cut])
+                    word = word[cut:]
+                    word_width = self.get_string_width(word)
+                line = [word]
+                line_width = word_width
+            lines.append(' '.join(line))
+        return lines
+
+    def table_rows(self, widths, rows, line_height, header=None, header_height=None, header_font=None,
+                   fill_header=True, progress=None, fill_rows=False):
+        """Draw a bordered table of wrapping cells starting at the current position.
+
+        Every row is measured before anything is drawn. A row that does not
+        fit on the page moves to the next one, where ``header`` is drawn
+        again; a row taller than a whole page is split across pages. The
+        table starts on a new page when the header and its first row would
+        not fit. Column borders are drawn once per page instead of once per
+        row. ``progress(done, total)`` is called after each row.
+        """
         x = self.get_x()
-        y = self.get_y()
-        maxheight = 0
-        
-        for i in range(cells):
-            self.multi_cell(width, height, data[i], fill=filling)
-            # print(f"After multi_cell, filling: {filling}")
-            if self.get_y() - y > maxheight:
-                maxheight = self.get_y() - y
-            self.set_xy(x + (width * (i + 1)), y)
-        
-        for i in range(cells + 1):
-            self.line(x + width * i, y, x + width * i, y + maxheight)
-        
-        self.line(x, y, x + width * cells, y)
-        self.line(x, y + maxheight, x + width * cells, y + maxheight)
-        
-        self.set_y(y + maxheight)
+        total_width = sum(widths)
+        lefts = [x + sum(widths[:i]) for i in range(len(widths))]
+        body_font = (self.font_family, self.font_style, self.font_size_pt)
+        header_font = header_font or body_font
+
+        with metrics.span('pdf.table_measure'):
+            measured = [[self.wrap_text(w, cell) for w, cell in zip(widths, row)] for row in rows]
+            if header:
+                self.set_font(*header_font)
+                header_lines = [self.wrap_text(w, cell) for w, cell in zip(widths, header)]
+                self.set_font(*body_font)
+
+        # Page breaks are decided here, so fpdf must not insert its own
+        auto_page_break, bottom_margin = self.auto_page_break, self.b_margin
+        self.set_auto_page_break(False, bottom_margin)
+
+        if header and measured and self.get_y() > self.t_margin:
+            header_space = max(len(lines) for lines in header_lines) * (header_height or line_height)
+            first_row = max(len(lines) for lines in measured[0]) * line_height
+            # A first row taller than a page would be split anyway; then one line must fit
+            room = self.page_break_trigger - self.t_margin - header_space
+            if self.get_y() + header_space + min(first_row, max(room, line_height)) > self.page_break_trigger + 1e-6:
+                self.add_page()
+                self.set_xy(x, self.t_margin)
+
+        state = {'top': self.get_y()}
+
+        def close_columns():
+            top, bottom = state['top'], self.get_y()
+            if bottom > top:
+                for left in lefts + [x + total_width]:
+                    self.line(left, top, left, bottom)
+
+        def draw_lines(cell_lines, start, end, height, fill):
+            y = self.get_y()
+            if fill:
+                self.set_fill_color(238, 238, 238)
+                self.rect(x, y, total_width, (end - start) * height, 'F')
+            for left, w, lines in zip(lefts, widths, cell_lines):
+                for i, line in enumerate(lines[start:end]):
+                    if line:
+                        self.set_xy(left, y + i * height)
+                        self.cell(w, height, line)
+            self.set_xy(x, y + (end - start) * height)
+            self.line(x, y, x + total_width, y)
+            self.line(x, self.get_y(), x + total_width, self.get_y())
+
+        def draw_header():
+            if header:
+                self.set_font(*header_font)
+                height = header_height or line_height
+                count = max(len(lines) for lines in header_lines)
+                draw_lines(header_lines, 0, count, height, fill_header)
+                self.set_font(*body_font)
+
+        def new_page():
+            close_columns()
+            self.add_page()
+            self.set_xy(x, self.t_margin)
+            state['top'] = self.get_y()
+            draw_header()
+            state['page_top'] = self.get_y()
+
+        with metrics.span('pdf.table_draw'):
+            if header:
+                draw_header()
+            # Rows are only split when moving them to a fresh page would not
+            # help; below other content, a new page always might
+            state['page_top'] = self.get_y() if state['top'] <= self.t_margin else self.t_margin
+
+            for done, cell_lines in enumerate(measured, 1):
+                count = max(len(lines) for lines in cell_lines)
+                start = 0
+                while start < count:
+                    fits = int((self.page_break_trigger - self.get_y()) / line_height + 1e-6)
+                    if fits < count - start and (self.get_y() > state['page_top'] or fits <= 0):
+                        new_page()
+                        continue
+                    end = min(count, start + fits)
+                    draw_lines(cell_lines, start, end, line_height, fill_rows)
+                    start = end
+                if progress:
+                    progress(done, len(measured))
+
+            close_columns()
+        self.set_auto_page_break(auto_page_break, bottom_margin)
+        self.set_y(self.get_y())
+
+    def multi_cell_row(self, cells, width, height, data, to_fill=False):
+        """One table row of ``cells`` equally wide cells; see table_rows."""
+        self.table_rows([width] * cells, [data], height, fill_rows=to_fill)
 
 
     def generate_invoice(self, items):
@@ -0,0 +1,34 @@
+import db
+
+SUGGESTION_LIMIT = 20
+# Sorts after every character, so prefix || PREFIX_END bounds a prefix range
+PREFIX_END = chr(0x10FFFF)
+
+# Both are range scans on an index (phone's UNIQUE one, name's NOCASE one),
+# so a lookup reads only the rows it returns however many customers there are
+SELECT_BY_PHONE = """SELECT customer_id, name, phone FROM customers
+                     WHERE phone >= :prefix AND phone < :prefix || :end ORDER BY phone LIMIT :limit"""
+SELECT_BY_NAME = """SELECT customer_id, name, phone FROM customers
+                    WHERE name >= :prefix AND name < :prefix || :end ORDER BY name LIMIT :limit"""
+
+
+def suggest(text, limit=SUGGESTION_LIMIT, conn=None):
+    """Customers whose phone (when ``text`` is digits) or name starts with ``text``.
+
+    Names match case-insensitively. Returns ``(customer_id, name, phone)`` rows.
+    """
+    text = text.strip()
+    if not text:
+        return []
+    conn = conn or db.get_connection()
+    sql = SELECT_BY_PHONE if text.isdigit() else SELECT_BY_NAME
+    return conn.execute(sql, {'prefix': text, 'end': PREFIX_END, 'limit': limit}).fetchall()
+
+
+def fetch_customer(customer_id, conn=None):
+    conn = conn or db.get_connection()
+    row = conn.execute("SELECT customer_id, name, phone FROM customers WHERE customer_id = ?",
+                       (customer_id,)).fetchone()
+    if row is None:
+        raise LookupError(f'Customer {customer_id} does not exist')
+    return row
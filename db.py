@@ -0,0 +1,143 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from migrations import migrate
+
+DB_PATH = os.environ.get('INVOICES_DB', 'invoices.db')
+
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KIB = 16 * 1024
+STATEMENT_CACHE_SIZE = 256
+
+# Kept as constants so sqlite3's per-connection statement cache, which is
+# keyed on the SQL text, hands back the same prepared statement every time
+SELECT_INVOICE = "SELECT * FROM invoices WHERE invoice_id = ?"
+SELECT_ITEMS = "SELECT * FROM invoice_items WHERE invoice_id = ?"
+SELECT_INVOICE_PAGE = "SELECT * FROM invoices WHERE invoice_id > ? ORDER BY invoice_id LIMIT ?"
+# The cents columns are computed from the amounts in SQL, so callers only
+# pass the amounts
+INSERT_INVOICE = """INSERT INTO invoices (date, venue, customer_name, customer_phone, total_amount, paid_amount, remaining_amount, paid_status,
+                                          total_cents, paid_cents, remaining_cents, customer_id)
+                    VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8,
+                            CAST(ROUND(?5 * 100) AS INTEGER), CAST(ROUND(?6 * 100) AS INTEGER), CAST(ROUND(?7 * 100) AS INTEGER),
+                            (SELECT customer_id FROM customers WHERE phone = ?4))"""
+INSERT_INVOICE_WITH_ID = """INSERT INTO invoices (invoice_id, date, venue, customer_name, customer_phone, total_amount, paid_amount, remaining_amount, paid_status,
+                                                  total_cents, paid_cents, remaining_cents, customer_id)
+                            VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8, ?9,
+                                    CAST(ROUND(?6 * 100) AS INTEGER), CAST(ROUND(?7 * 100) AS INTEGER), CAST(ROUND(?8 * 100) AS INTEGER),
+                                    (SELECT customer_id FROM customers WHERE phone = ?5))"""
+# Customers are keyed by phone; a returning customer's name follows their latest invoice
+UPSERT_CUSTOMER = """INSERT INTO customers (name, phone) SELECT ?1, ?2 WHERE ?2 != ''
+                     ON CONFLICT(phone) DO UPDATE SET name = excluded.name WHERE name != excluded.name"""
+INSERT_ITEM = """INSERT INTO invoice_items (invoice_id, name, description, price, quantity, total_price)
+                 VALUES (?, ?, ?, ?, ?, ?)"""
+
+_local = threading.local()
+_migrated = set()
+_migrate_lock = threading.Lock()
+
+
+def connect(db_path=None):
+    """Open a new connection with the pragmas the rest of the app relies on.
+
+    Most code should use get_connection() instead; this is for callers that
+    manage a connection's lifetime themselves, like pool worker processes.
+    """
+    db_path = db_path or DB_PATH
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    # WAL lets the viewer read while another window or process writes, and
+    # with synchronous=NORMAL a commit no longer waits for an fsync
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+    with _migrate_lock:
+        key = os.path.abspath(db_path)
+        if key not in _migrated:
+            migrate(conn)
+            _migrated.add(key)
+    return conn
+
+
+def get_connection(db_path=None):
+    """The calling thread's long-lived connection to ``db_path``."""
+    db_path = db_path or DB_PATH
+    # A forked worker must not reuse its parent's connections
+    if getattr(_local, 'pid', None) != os.getpid():
+        _local.pid = os.getpid()
+        _local.connections = {}
+
+    conn = _local.connections.get(db_path)
+    if conn is None:
+        conn = _local.connections[db_path] = connect(db_path)
+    return conn
+
+
+def close_connections():
+    for conn in getattr(_local, 'connections', {}).values():
+        conn.close()
+    _local.connections = {}
+
+
+@contextmanager
+def suspended_triggers(conn, names):
+    """Drop the named triggers for the duration of the block, then recreate them.
+
+    Only use inside a write transaction (BEGIN IMMEDIATE): DDL is
+    transactional in SQLite, so other connections never see the triggers
+    missing, and the caller must do the triggers' work itself.
+    """
+    placeholders = ', '.join('?' * len(names))
+    definitions = [row[0] for row in conn.execute(
+        f"SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name IN ({placeholders})", names)]
+    for name in names:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    try:
+        yield
+    finally:
+        for sql in definitions:
+            conn.execute(sql)
+
+
+def fetch_invoice(invoice_id, conn=None):
+    conn = conn or get_connection()
+    invoice = conn.execute(SELECT_INVOICE, (invoice_id,)).fetchone()
+    if invoice is None:
+        # Old paid invoices may have moved to an archive file
+        from archive import fetch_archived
+
+        return fetch_archived(invoice_id, conn)
+    items = conn.execute(SELECT_ITEMS, (invoice_id,)).fetchall()
+    return invoice, items
+
+
+def fetch_invoice_page(after_id, limit, conn=None):
+    conn = conn or get_connection()
+    return conn.execute(SELECT_INVOICE_PAGE, (after_id, limit)).fetchall()
+
+
+def add_invoice(conn, invoice, items):
+    """Insert an invoice and its items inside the caller's transaction; see insert_invoice."""
+    conn.execute(UPSERT_CUSTOMER, invoice[2:4])
+    invoice_id = conn.execute(INSERT_INVOICE, invoice).lastrowid
+    conn.executemany(INSERT_ITEM, [(invoice_id, *item) for item in items])
+    return (invoice_id, *invoice), [(None, invoice_id, *item) for item in items]
+
+
+def insert_invoice(date, venue, customer_name, customer_phone, total_amount, paid_amount,
+                   remaining_amount, paid_status, items, conn=None):
+    """Insert an invoice and its ``(name, description, price, quantity, total_price)`` items.
+
+    Returns the new rows shaped like fetch_invoice() so the caller can render
+    without reading them back. Item ids are not read back and are None.
+    """
+    conn = conn or get_connection()
+    invoice = (date, venue, customer_name, customer_phone, total_amount, paid_amount,
+               remaining_amount, paid_status)
+    with conn:
+        return add_invoice(conn, invoice, items)
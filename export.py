@@ -0,0 +1,293 @@
+import argparse
+import csv
+import gzip
+import json
+import os
+import time
+import zipfile
+from datetime import datetime
+
+import archive
+import db
+from db import DB_PATH
+from layout import get_layout
+from render import build_invoice_pdf
+
+
+def invoice_filter(ids=None, start=None, end=None, month=None, where=None, params=()):
+    """A ``(where, params)`` pair selecting invoices, as accepted by iter_invoices."""
+    clauses = []
+    args = []
+    if ids:
+        clauses.append(f"invoices.invoice_id IN ({', '.join('?' * len(ids))})")
+        args.extend(ids)
+    if start is not None:
+        clauses.append("invoices.invoice_id >= ?")
+        args.append(start)
+    if end is not None:
+        clauses.append("invoices.invoice_id <= ?")
+        args.append(end)
+    if month:
+        # Dates are YYYY-MM-DD, so a month is a range on the date index
+        clauses.append("invoices.date BETWEEN ? AND ?")
+        args.extend((f"{month}-01", f"{month}-31"))
+    if where:
+        clauses.append(f"({where})")
+        args.extend(params)
+    return " AND ".join(clauses) or "1", args
+
+
+def _tables(archived, conn):
+    """The invoice and item tables to read: the live ones, or with ``archived``, views that add the archives."""
+    if archived:
+        archive.attach_archives(conn)
+        return 'all_invoices', 'all_invoice_items'
+    return 'invoices', 'invoice_items'
+
+
+def count_invoices(where="1", params=(), conn=None, archived=False):
+    conn = conn or db.get_connection()
+    invoices, _ = _tables(archived, conn)
+    return conn.execute(f"SELECT COUNT(*) FROM {invoices} AS invoices WHERE {where}", params).fetchone()[0]
+
+
+def iter_invoices(where="1", params=(), conn=None, archived=False):
+    """Yield ``(invoice, items)`` in id order, reading one invoice at a time from a cursor.
+
+    Archived invoices are left out unless ``archived`` is set.
+    """
+    conn = conn or db.get_connection()
+    invoices, items = _tables(archived, conn)
+    select_items = f"SELECT * FROM {items} WHERE invoice_id = ?"
+    for invoice in conn.execute(f"SELECT * FROM {invoices} AS invoices WHERE {where} ORDER BY invoice_id", params):
+        yield invoice, conn.execute(select_items, (invoice[0],)).fetchall()
+
+
+def export_zip(path, invoices, progress=None):
+    """Write every ``(invoice, items)`` as invoice_{id}.pdf into a ZIP at ``path``.
+
+    Each PDF is rendered to memory and written into the archive before the
+    next one is read, so peak memory is about one invoice. PDF content is
+    already compressed, so entries are stored rather than deflated again.
+    No file is created when there are no invoices.
+    """
+    count = 0
+    archive = None
+    try:
+        for invoice, items in invoices:
+            if archive is None:
+                archive = zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED)
+            archive.writestr(f"invoice_{invoice[0]}.pdf", bytes(build_invoice_pdf(invoice, items).output()))
+            count += 1
+            if progress:
+                progress(count)
+    finally:
+        if archive is not None:
+            archive.close()
+    return count
+
+
+def export_merged_pdf(path, invoices, progress=None):
+    """Append every ``(invoice, items)`` to one PDF at ``path``.
+
+    The logo image and fonts are embedded once and shared by all pages,
+    which is what makes the result far smaller than the separate files.
+    fpdf keeps the page content streams in memory until output, a few KB
+    per invoice page; the invoice and item rows themselves are never held
+    beyond the invoice being drawn.
+    """
+    from custom import CustomPDF
+
+    layout = get_layout()
+    pdf = CustomPDF()
+    count = 0
+    for invoice, items in invoices:
+        layout.draw(pdf, invoice, items)
+        count += 1
+        if progress:
+            progress(count)
+    if count:
+        pdf.output(path)
+    return count
+
+
+LINE_COLUMNS = ('invoice_id', 'date', 'venue', 'customer_name', 'customer_phone', 'total_amount',
+                'paid_amount', 'remaining_amount', 'paid_status', 'item_id', 'item_name',
+                'item_description', 'price', 'quantity', 'total_price')
+LINE_FORMATS = ('.csv', '.jsonl')
+
+# One ordered join: invoices walked by primary key and each one's items
+# through the invoice_id index, so rows come out in order without a sort
+# and the cursor hands them over one at a time. Invoices without items
+# still get a row, with empty item columns. An archive file holds its
+# invoices' items too, so archives get the same join each, in a UNION ALL
+# that SQLite merges in order, instead of a join between the all_* views.
+SELECT_LINES = """SELECT invoices.invoice_id, invoices.date, invoices.venue, invoices.customer_name,
+                         invoices.customer_phone, invoices.total_amount, invoices.paid_amount,
+                         invoices.remaining_amount, invoices.paid_status, invoice_items.item_id,
+                         invoice_items.name, invoice_items.description, invoice_items.price,
+                         invoice_items.quantity, invoice_items.total_price
+                  FROM {schema}.invoices AS invoices
+                  LEFT JOIN {schema}.invoice_items AS invoice_items ON invoice_items.invoice_id = invoices.invoice_id
+                  WHERE invoices.invoice_id > ? AND ({where})"""
+
+
+def iter_lines(where="1", params=(), after_id=0, conn=None, archived=False):
+    """Yield one tuple per invoice item, in LINE_COLUMNS order, for invoices after ``after_id``."""
+    conn = conn or db.get_connection()
+    schemas = ['main', *(archive.attach_archives(conn) if archived else [])]
+    sql = " UNION ALL ".join(SELECT_LINES.format(schema=schema, where=where) for schema in schemas)
+    yield from conn.execute(sql + " ORDER BY 1, 10", (after_id, *params) * len(schemas))
+
+
+def _open_lines(path, compress):
+    if compress:
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def write_lines(path, rows, rows_per_file=None, progress=None, overwrite=True):
+    """Stream ``rows`` into a .csv or .jsonl file at ``path``, gzipped if it ends in .gz.
+
+    With ``rows_per_file`` the rows go to files named after the first
+    invoice id in each, like path-00000001.csv, starting a new file at the
+    first invoice boundary after that many rows so no invoice is split.
+    Each file is written under a .part name and renamed once complete; with
+    ``overwrite`` false an existing file raises FileExistsError instead.
+    Only the current row is ever held. Returns ``(row count, last invoice
+    id, paths written)``.
+    """
+    compress = path.endswith('.gz')
+    stem, ext = os.path.splitext(path[:-3] if compress else path)
+    if ext not in LINE_FORMATS:
+        raise ValueError(f'Cannot export lines to {path}: use .csv or .jsonl, optionally with .gz')
+    suffix = ext + ('.gz' if compress else '')
+
+    paths = []
+    f = None
+    count = in_file = 0
+    last_id = None
+    try:
+        for row in rows:
+            if f is None or (rows_per_file and in_file >= rows_per_file and row[0] != last_id):
+                if f is not None:
+                    f.close()
+                    os.replace(paths[-1] + '.part', paths[-1])
+                    f = None
+                target = f"{stem}-{row[0]:08d}{suffix}" if rows_per_file else path
+                if not overwrite and os.path.exists(target):
+                    raise FileExistsError(f'{target} already exists')
+                paths.append(target)
+                f = _open_lines(paths[-1] + '.part', compress)
+                if ext == '.csv':
+                    out = csv.writer(f)
+                    out.writerow(LINE_COLUMNS)
+                in_file = 0
+            if ext == '.csv':
+                out.writerow(row)
+            else:
+                f.write(json.dumps(dict(zip(LINE_COLUMNS, row))) + '\n')
+            count += 1
+            in_file += 1
+            last_id = row[0]
+            if progress and count % 10000 == 0:
+                progress(count)
+    except BaseException:
+        if f is not None:
+            f.close()
+            os.remove(paths.pop() + '.part')
+        raise
+    if f is not None:
+        f.close()
+        os.replace(paths[-1] + '.part', paths[-1])
+    return count, last_id, paths
+
+
+def export_lines(path, where="1", params=(), incremental=None, rows_per_file=None, conn=None, progress=None,
+                 archived=False):
+    """Export invoice items joined with their invoices; see write_lines.
+
+    With ``incremental`` set to a name, only invoices after the last one
+    that name exported are written, and the checkpoint moves forward once
+    every file is complete. Invoices changed after they were exported (a
+    later payment, say) are not exported again. An incremental export never
+    overwrites an earlier one's files: give each run its own ``path`` or
+    use ``rows_per_file``, whose file names start at each file's first
+    invoice. Archived invoices are left out unless ``archived`` is set.
+    Returns ``(row count, paths written)``.
+    """
+    conn = conn or db.get_connection()
+    after_id = 0
+    if incremental:
+        row = conn.execute("SELECT last_invoice_id FROM export_checkpoints WHERE name = ?", (incremental,)).fetchone()
+        after_id = row[0] if row else 0
+
+    count, last_id, paths = write_lines(path, iter_lines(where, params, after_id, conn, archived), rows_per_file, progress,
+                                        overwrite=not incremental)
+    if incremental and last_id is not None:
+        with conn:
+            conn.execute("""INSERT INTO export_checkpoints (name, last_invoice_id, updated_at) VALUES (?, ?, ?)
+                            ON CONFLICT(name) DO UPDATE SET last_invoice_id = excluded.last_invoice_id,
+                                                            updated_at = excluded.updated_at""",
+                         (incremental, last_id, datetime.now().isoformat(timespec='seconds')))
+    return count, paths
+
+
+def _is_lines(path):
+    return os.path.splitext(path[:-3] if path.endswith('.gz') else path)[1] in LINE_FORMATS
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export many invoices as one ZIP of PDFs or one merged PDF, '
+                                                 'or their line items as CSV or JSONL.')
+    parser.add_argument('out', help='output file; a .pdf name gives one merged PDF, .csv or .jsonl (optionally .gz) '
+                                    'the line items, anything else a ZIP')
+    parser.add_argument('ids', nargs='*', type=int, help='invoice ids to export')
+    parser.add_argument('--from', dest='start', type=int, help='first invoice id of a range')
+    parser.add_argument('--to', dest='end', type=int, help='last invoice id of a range')
+    parser.add_argument('--month', help='only invoices dated in this month, as YYYY-MM')
+    parser.add_argument('--where', help="SQL condition on invoices, e.g. \"paid_status = 'Not Paid'\"")
+    parser.add_argument('--gzip', action='store_true', help='gzip a CSV or JSONL export (same as a .gz name)')
+    parser.add_argument('--rows-per-file', type=int, help='split a CSV or JSONL export into files of about this many rows')
+    parser.add_argument('--incremental', metavar='NAME',
+                        help='only export invoices added since the last export with this name')
+    parser.add_argument('--include-archived', action='store_true',
+                        help='also export invoices moved to the yearly archives, which are left out by default')
+    parser.add_argument('--db', default=DB_PATH, help='path to invoices.db')
+    args = parser.parse_args(argv)
+
+    conn = db.get_connection(args.db)
+    where, params = invoice_filter(args.ids, args.start, args.end, args.month, args.where)
+    started = time.perf_counter()
+
+    if _is_lines(args.out):
+        out = args.out + '.gz' if args.gzip and not args.out.endswith('.gz') else args.out
+        try:
+            count, paths = export_lines(out, where, params, args.incremental, args.rows_per_file, conn,
+                                        lambda done: print(f"\r{done} rows", end='', flush=True), args.include_archived)
+        except FileExistsError as e:
+            parser.error(f"{e}; an incremental export does not overwrite earlier ones")
+        if count:
+            print(f"\rExported {count} rows to {', '.join(paths)} in {time.perf_counter() - started:.2f}s")
+        else:
+            print("No invoices matched")
+        return 0
+
+    total = count_invoices(where, params, conn, args.include_archived)
+    export = export_merged_pdf if args.out.lower().endswith('.pdf') else export_zip
+
+    def progress(done):
+        if done % 100 == 0 or done == total:
+            print(f"\r{done}/{total} invoices", end='', flush=True)
+
+    count = export(args.out, iter_invoices(where, params, conn, args.include_archived), progress)
+    if count:
+        print(f"\nExported {count} invoices to {args.out} ({os.path.getsize(args.out) / 1024:.0f} KiB) "
+              f"in {time.perf_counter() - started:.2f}s")
+    else:
+        print("No invoices matched")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,258 @@
+from string import Formatter
+
+import metrics
+
+# fpdf is imported on first compile/render rather than here: it takes a few
+# hundred milliseconds, and the template constants are needed without it
+
+# Bump whenever INVOICE_TEMPLATE changes so anything keyed on the rendered
+# output knows old PDFs are stale
+TEMPLATE_VERSION = 1
+
+LOGO_PATH = 'logo_resized.png'
+
+BLACK = (0, 0, 0)
+WHITE = (255, 255, 255)
+GREY = (238, 238, 238)
+
+HEADING = ('Helvetica', 'B', 14)
+VALUE = ('Helvetica', '', 14)
+DETAILS = ('Helvetica', '', 10)
+
+
+def _pair(x, y, label, value, widths, label_font=None, value_font=None, value_fill=None, multi=False):
+    kind = 'multi_cell' if multi else 'cell'
+    return [
+        {'type': kind, 'at': (x, y), 'size': (widths[0], 7), 'text': label,
+         'font': label_font, 'fill': GREY, 'border': 1},
+        {'type': kind, 'at': (x + widths[0], y), 'size': (widths[1], 7), 'text': value,
+         'font': value_font or label_font, 'fill': value_fill, 'border': 1},
+    ]
+
+
+def _terms(x, *paragraphs):
+    elements = []
+    for text in paragraphs:
+        elements.append({'type': 'paragraph', 'size': (200, 4), 'text': text, 'font': DETAILS})
+        elements.append({'type': 'ln', 'h': 1})
+    elements[0]['x'] = x
+    return elements[:-1]
+
+
+# The invoice page, top to bottom. Text containing {fields} is bound per
+# invoice; everything else is resolved once by compile_layout.
+INVOICE_TEMPLATE = [
+    # Invoice Header
+    {'type': 'cell', 'at': (0, 5), 'size': (210, 10), 'text': 'INVOICE', 'align': 'C',
+     'font': ('Helvetica', 'B', 15), 'fill': BLACK, 'color': WHITE},
+    {'type': 'image', 'path': LOGO_PATH, 'at': (10, 20), 'size': (50, 35)},
+
+    # Align right with Logo
+    *_pair(120, 30, 'Invoice ID:', '{invoice_id}', (30, 40), HEADING, VALUE),
+    *_pair(120, 37, 'Date:', '{date}', (30, 40), HEADING, VALUE),
+    *_pair(120, 44, 'Venue:', '{venue}', (30, 40), HEADING, VALUE, multi=True),
+
+    # Below Logo Customer Details
+    *_pair(7, 61, 'Customer Name:', '{customer_name}', (41, 43), DETAILS, value_fill=GREY),
+    *_pair(7, 68, 'Customer Phone:', '{customer_phone}', (41, 43), DETAILS, value_fill=GREY),
+
+    # Align right with Customer Details
+    *_pair(120, 61, 'Account Title:', 'Rameez Ahmed', (30, 55), DETAILS),
+    *_pair(120, 68, 'Account Number:', '00207901029503', (30, 55), DETAILS),
+    *_pair(120, 75, 'IBAN:', 'PK58HABB0000207901029503', (30, 55), DETAILS),
+
+    {'type': 'items', 'at': (5, 89)},
+
+    # Additional Notes
+    {'type': 'ln'},
+    {'type': 'cell', 'size': (190, 10), 'text': 'ADDITIONAL NOTES', 'align': 'C', 'font': ('Helvetica', 'B', 15)},
+    {'type': 'ln'},
+    {'type': 'cell', 'x': 0, 'size': (210, 0.5), 'text': '', 'fill': BLACK},
+    {'type': 'ln'},
+    {'type': 'ln'},
+
+    {'type': 'cell', 'x': 2, 'size': (200, 6), 'text': 'Payment Terms:', 'font': ('Helvetica', 'B', 12)},
+    {'type': 'ln'},
+    {'type': 'paragraph', 'x': 10, 'size': (200, 4), 'font': DETAILS,
+     'text': "- A 50% advance will be given before the event, and the remaining payment will be cleared by the next day of the event. Otherwise, raw data will not be provided for selection."},
+    {'type': 'ln'},
+
+    {'type': 'cell', 'x': 2, 'size': (200, 4), 'text': 'Terms and Conditions:', 'font': ('Helvetica', 'B', 12)},
+    {'type': 'ln'},
+    *_terms(
+        10,
+        '- No payment will be refunded in case of any mishap or unforeseen situation / circumstances occurred.',
+        '- Client can only provide the extended date of the event.',
+        '- Misbehavior of client will not be accepted',
+        "- If photographer provides any suggestion / advice regarding event management and client don't listen or take it seriously so it will be not our responsibility.",
+        '- Client Pictures will be used on our page regarding marketing purposes at Instagram and Facebook.',
+        '- Ask for update on editing after 15 days of the event.',
+        'Kindly read this E-mail and instructions carefully and reply back to this but E-mail for confirmation. If any query so please contact us on:',
+        '+923142179245',
+    ),
+]
+
+# Marker op for the per-invoice item rows
+ITEMS = object()
+
+# How many item rows are drawn between two progress callbacks
+PROGRESS_STEP = 25
+
+
+def _image(pdf, *args, **kwargs):
+    # Decoding and compressing the logo is a phase of its own in the metrics
+    with metrics.span('render.image'):
+        pdf.image(*args, **kwargs)
+
+
+def _has_fields(text):
+    return any(field is not None for _, field, _, _ in Formatter().parse(text))
+
+
+def compile_layout(template=INVOICE_TEMPLATE):
+    """Turn a template into a flat list of ``(method, args, kwargs, field_text)`` ops.
+
+    Font and colour changes are only emitted when they differ from the
+    current state, and static paragraphs are line-broken here once instead
+    of on every render.
+    """
+    from fpdf.enums import XPos, YPos
+
+    from custom import CustomPDF
+
+    measure = CustomPDF()
+    measure.add_page()
+
+    ops = []
+    state = {'font': None, 'fill': None, 'color': None}
+
+    def emit(method, *args, **kwargs):
+        ops.append((method, args, kwargs, None))
+
+    def use(key, value, method):
+        if value is not None and state[key] != value:
+            state[key] = value
+            emit(method, *value)
+
+    for element in template:
+        kind = element['type']
+
+        if 'at' in element:
+            emit(CustomPDF.set_xy, *element['at'])
+        elif 'x' in element:
+            emit(CustomPDF.set_x, element['x'])
+
+        if kind == 'ln':
+            emit(CustomPDF.ln, element.get('h'))
+            continue
+        if kind == 'image':
+            x, y = element['at']
+            w, h = element['size']
+            emit(_image, element['path'], x=x, y=y, w=w, h=h)
+            continue
+        if kind == 'items':
+            ops.append((ITEMS, (), {}, None))
+            # The table changes fill colour and font as it goes
+            state['fill'] = state['font'] = None
+            continue
+
+        font = element.get('font')
+        use('font', font, CustomPDF.set_font)
+        use('fill', element.get('fill'), CustomPDF.set_fill_color)
+        use('color', element.get('color', BLACK), CustomPDF.set_text_color)
+
+        w, h = element['size']
+        text = element['text']
+        kwargs = {'align': element.get('align', 'L'), 'border': element.get('border', 0),
+                  'fill': 'fill' in element and element['fill'] is not None}
+
+        if kind == 'paragraph':
+            measure.set_font(*state['font'])
+            lines = measure.multi_cell(w, h, text, dry_run=True, output='LINES')
+            for line in lines:
+                emit(CustomPDF.cell, w, h, line, new_x=XPos.LEFT, new_y=YPos.NEXT, **kwargs)
+        else:
+            method = CustomPDF.multi_cell if kind == 'multi_cell' else CustomPDF.cell
+            if _has_fields(text):
+                ops.append((method, (w, h), kwargs, text))
+            else:
+                emit(method, w, h, text, **kwargs)
+
+    return CompiledLayout(ops)
+
+
+def bind_fields(invoice):
+    return {
+        'invoice_id': invoice[0],
+        'date': invoice[1],
+        'venue': invoice[2],
+        'customer_name': invoice[3],
+        'customer_phone': invoice[4],
+        'total_amount': invoice[5],
+        'paid_amount': invoice[6],
+        'remaining_amount': invoice[7],
+        'paid_status': invoice[8],
+    }
+
+
+class CompiledLayout:
+    def __init__(self, ops):
+        self.ops = ops
+
+    def draw(self, pdf, invoice, items, progress=None):
+        """Append one invoice page to ``pdf``.
+
+        ``progress(done, total)`` is called as item rows are drawn.
+        """
+        fields = bind_fields(invoice)
+        pdf.add_page()
+        pdf.set_char_spacing(0)
+
+        for method, args, kwargs, text in self.ops:
+            if method is ITEMS:
+                self.draw_items(pdf, fields, items, progress)
+            elif text is None:
+                method(pdf, *args, **kwargs)
+            else:
+                method(pdf, *args, text.format_map(fields), **kwargs)
+
+    def draw_items(self, pdf, fields, items, progress=None):
+        header = ["Item Name", "Description", "Price", "Quantity", "Total Price"]
+        header_font = (pdf.font_family, pdf.font_style, pdf.font_size_pt)
+
+        def item_progress(done, total):
+            if done % PROGRESS_STEP == 0 or done == total:
+                progress(done, total)
+
+        pdf.set_font("Helvetica", size=11, style='')
+        rows = [(item[2], item[3], f"{item[4]:.2f}", str(item[5]), f"{item[6]:.2f}") for item in items]
+        pdf.table_rows([40] * 5, rows, 5, header=header, header_height=10, header_font=header_font,
+                       progress=item_progress if progress else None)
+        if progress and not items:
+            progress(0, 0)
+
+        pdf.set_font("Helvetica", size=12)
+        pdf.set_x(x=5)
+        pdf.table_rows([40] * 5, [("", "", "", label, value) for label, value in (
+            ("Total Amount", f"{fields['total_amount']:.2f}"),
+            ("Paid Amount", f"{fields['paid_amount']:.2f}"),
+            ("Remaining Amount", f"{fields['remaining_amount']:.2f}"),
+            ("Paid Status", f"{fields['paid_status']}"))], 10)
+
+    def render(self, invoice, items, progress=None):
+        from custom import CustomPDF
+
+        pdf = CustomPDF()
+        self.draw(pdf, invoice, items, progress)
+        return pdf
+
+
+_compiled = None
+
+
+def get_layout():
+    """The compiled invoice layout, built on first use and shared afterwards."""
+    global _compiled
+    if _compiled is None:
+        _compiled = compile_layout()
+    return _compiled
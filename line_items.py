@@ -0,0 +1,106 @@
+from decimal import ROUND_HALF_UP, Decimal, DecimalException
+
+# The largest amount the form's validators accept
+MAX_AMOUNT = Decimal('99999999.99')
+
+
+def to_cents(value):
+    """Parse an amount like ``'12.5'`` or ``12.5`` into integer cents.
+
+    Raises ValueError for anything else, including infinities, NaN and
+    amounts beyond MAX_AMOUNT.
+    """
+    try:
+        amount = Decimal(str(value).strip() or '0')
+        if not amount.is_finite() or abs(amount) > MAX_AMOUNT:
+            raise ValueError(f'Invalid amount: {value!r}')
+        return int((amount * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+    except DecimalException:
+        raise ValueError(f'Invalid amount: {value!r}')
+
+
+def format_cents(cents):
+    sign = '-' if cents < 0 else ''
+    return f"{sign}{abs(cents) // 100}.{abs(cents) % 100:02d}"
+
+
+def paid_status(remaining_cents):
+    return "Paid" if remaining_cents == 0 else "Not Paid"
+
+
+class LineItem:
+    __slots__ = ('name', 'description', 'price_cents', 'quantity')
+
+    def __init__(self, name, description, price_cents, quantity):
+        self.name = name
+        self.description = description
+        self.price_cents = price_cents
+        self.quantity = quantity
+
+    @property
+    def total_cents(self):
+        return self.price_cents * self.quantity
+
+
+class LineItems:
+    """The line items of the invoice being edited, with running totals.
+
+    Amounts are integer cents. Every change adjusts the total by the
+    difference it makes instead of summing all rows again.
+    """
+
+    def __init__(self):
+        self.items = []
+        self.total_cents = 0
+        self.paid_cents = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+    @property
+    def remaining_cents(self):
+        return self.total_cents - self.paid_cents
+
+    @property
+    def paid_status(self):
+        return paid_status(self.remaining_cents)
+
+    @staticmethod
+    def validate(price_cents, quantity):
+        if price_cents < 0 or quantity <= 0:
+            raise ValueError('Price must not be negative and quantity must be positive')
+        if price_cents * quantity > MAX_AMOUNT * 100:
+            raise ValueError(f'Line total is more than {MAX_AMOUNT}')
+
+    def add(self, name, description, price_cents, quantity):
+        self.validate(price_cents, quantity)
+        item = LineItem(name, description, price_cents, quantity)
+        self.items.append(item)
+        self.total_cents += item.total_cents
+        return len(self.items) - 1
+
+    def update(self, index, **fields):
+        item = self.items[index]
+        self.validate(fields.get('price_cents', item.price_cents), fields.get('quantity', item.quantity))
+
+        self.total_cents -= item.total_cents
+        for field, value in fields.items():
+            setattr(item, field, value)
+        self.total_cents += item.total_cents
+
+    def remove(self, index):
+        item = self.items.pop(index)
+        self.total_cents -= item.total_cents
+
+    def clear(self):
+        self.items = []
+        self.total_cents = 0
+        self.paid_cents = 0
+
+    def rows(self):
+        """``(name, description, price, quantity, total_price)`` tuples as stored in invoice_items."""
+        return [(item.name, item.description, item.price_cents / 100, item.quantity, item.total_cents / 100)
+                for item in self.items]
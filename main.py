@@ -1,41 +1,170 @@
-import sys
+import argparse
 import sqlite3
+import sys
+import time
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QFormLayout, QLineEdit, QLabel,
     QDateEdit, QTableWidget, QHeaderView, QPushButton, QGroupBox, QHBoxLayout, QMessageBox,
-    QTableWidgetItem, QGridLayout, QInputDialog
+    QTableWidgetItem, QGridLayout, QInputDialog, QTableView, QAbstractItemView, QProgressBar, QTabWidget,
+    QComboBox, QDialog, QDialogButtonBox, QCheckBox, QCompleter
 )
-from PyQt5.QtCore import QDate, Qt
-from PyQt5.QtGui import QDoubleValidator, QIntValidator, QFont
-from fpdf import FPDF
-from custom import CustomPDF
-
-# Database setup
-conn = sqlite3.connect('invoices.db')
-c = conn.cursor()
-c.execute('''CREATE TABLE IF NOT EXISTS invoices
-             (invoice_id INTEGER PRIMARY KEY AUTOINCREMENT,
-              date TEXT,
-              venue TEXT,
-              customer_name TEXT,
-              customer_phone TEXT,
-              total_amount REAL,
-              paid_amount REAL,
-              remaining_amount REAL,
-              paid_status TEXT)''')
-# conn.commit()
-
-
-c.execute('''CREATE TABLE IF NOT EXISTS invoice_items
-             (item_id INTEGER PRIMARY KEY AUTOINCREMENT,
-              invoice_id INTEGER,
-              name TEXT,
-              description TEXT,
-              price REAL,
-              quantity INTEGER,
-              total_price REAL,
-              FOREIGN KEY(invoice_id) REFERENCES invoices(invoice_id))''')
-conn.commit()
+from PyQt5.QtCore import QDate, Qt, QAbstractTableModel, QModelIndex, QTimer, pyqtSignal
+from PyQt5.QtGui import QDoubleValidator, QIntValidator, QFont, QStandardItem, QStandardItemModel
+import customers
+import db
+import metrics
+import payments
+import reports
+from catalog import ItemCatalog
+from search import SORT_COLUMNS, browse_invoices, search_invoices
+from line_items import LineItems, format_cents, to_cents
+from render import INVOICE_DIR
+from workers import LookupQueue, RenderQueue
+from writer import get_writer
+
+class RenderStatus(QWidget):
+    """Status bar widget showing queued PDF renders, with a way to cancel them."""
+
+    def __init__(self, window, queue):
+        super().__init__(window)
+        self.window = window
+        self.queue = queue
+
+        layout = QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.label = QLabel('', self)
+        self.progressBar = QProgressBar(self)
+        self.progressBar.setRange(0, 100)
+        self.progressBar.setMaximumWidth(160)
+        self.cancelButton = QPushButton('Cancel', self)
+        self.cancelButton.setToolTip("Cancel all queued PDF renders")
+        self.cancelButton.clicked.connect(self.queue.cancel_all)
+        layout.addWidget(self.label)
+        layout.addWidget(self.progressBar)
+        layout.addWidget(self.cancelButton)
+        self.setLayout(layout)
+
+        self.queue.progress.connect(self.on_progress)
+        self.queue.finished.connect(self.on_finished)
+        self.queue.failed.connect(self.on_failed)
+        self.queue.cancelled.connect(self.on_cancelled)
+        self.queue.pendingChanged.connect(self.on_pending_changed)
+        self.on_pending_changed(0)
+
+    def on_progress(self, job_id, percent, stage):
+        self.progressBar.setValue(percent)
+        self.progressBar.setFormat(f'{stage} %p%')
+
+    def on_finished(self, job_id, pdf_name):
+        self.window.statusBar().showMessage(f'PDF file has been generated: {pdf_name}', 10000)
+
+    def on_failed(self, job_id, error):
+        QMessageBox.warning(self.window, 'Error', f'PDF generation failed: {error}')
+
+    def on_cancelled(self, job_id):
+        self.window.statusBar().showMessage('PDF generation cancelled', 5000)
+
+    def on_pending_changed(self, pending):
+        self.label.setText(f'Rendering {pending} PDF(s)' if pending else '')
+        self.progressBar.setVisible(pending > 0)
+        self.cancelButton.setVisible(pending > 0)
+        if not pending:
+            self.progressBar.reset()
+
+    def shutdown(self):
+        self.queue.cancel_all()
+        self.queue.wait()
+
+
+class LineItemsModel(QAbstractTableModel):
+    """Editable view of the invoice's LineItems; totals follow every edit."""
+    HEADERS = ['Name', 'Description', 'Price', 'Quantity', 'Total Price']
+    totalsChanged = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.items = LineItems()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.items)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.EditRole):
+            return None
+        item = self.items[index.row()]
+        column = index.column()
+        if column == 0:
+            return item.name
+        if column == 1:
+            return item.description
+        if column == 2:
+            return format_cents(item.price_cents)
+        if column == 3:
+            return str(item.quantity)
+        return format_cents(item.total_cents)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def flags(self, index):
+        flags = super().flags(index)
+        if index.isValid() and index.column() < 4:
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.EditRole or not index.isValid():
+            return False
+        field = ('name', 'description', 'price_cents', 'quantity')[index.column()]
+        try:
+            if field == 'price_cents':
+                value = to_cents(value)
+            elif field == 'quantity':
+                value = int(value)
+            self.items.update(index.row(), **{field: value})
+        except ValueError:
+            return False
+        self.dataChanged.emit(index, self.index(index.row(), 4))
+        self.totalsChanged.emit()
+        return True
+
+    def add_item(self, name, description, price_cents, quantity):
+        LineItems.validate(price_cents, quantity)
+        row = len(self.items)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.items.add(name, description, price_cents, quantity)
+        self.endInsertRows()
+        self.totalsChanged.emit()
+
+    def remove_item(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self.items.remove(row)
+        self.endRemoveRows()
+        self.totalsChanged.emit()
+
+    def set_paid(self, paid_cents):
+        self.items.paid_cents = paid_cents
+        self.totalsChanged.emit()
+
+    def clear(self):
+        self.beginResetModel()
+        self.items.clear()
+        self.endResetModel()
+        self.totalsChanged.emit()
+
+
+# Roles on autocomplete suggestions; each field's completer inserts its own
+NAME_ROLE = Qt.UserRole + 1
+PHONE_ROLE = Qt.UserRole + 2
+ITEM_ROLE = Qt.UserRole + 3
+# How stale the in-memory item catalog may get before typing re-reads its changes
+CATALOG_REFRESH_SECONDS = 5
+
 
 class InvoiceGenerator(QMainWindow):
     def __init__(self):
@@ -80,12 +209,32 @@ class InvoiceGenerator(QMainWindow):
         self.phoneInput.setToolTip("Enter the customer's phone number")
         self.phoneInput.setValidator(QIntValidator())
         self.phoneInput.setFont(common_font)
+
+        # Returning customers: typing in either field suggests matches from
+        # the customers table, looked up off the GUI thread once typing
+        # pauses; picking one fills in both fields
+        self.customerSuggestions = QStandardItemModel(self)
+        self.customerLookups = LookupQueue(self)
+        self.customerLookups.finished.connect(self.show_customer_suggestions)
+        self.customerLookupTimer = QTimer(self)
+        self.customerLookupTimer.setSingleShot(True)
+        self.customerLookupTimer.setInterval(150)
+        self.customerLookupTimer.timeout.connect(self.lookup_customers)
+        self.customerLookupField = self.customerInput
+        for field, role in ((self.customerInput, NAME_ROLE), (self.phoneInput, PHONE_ROLE)):
+            completer = QCompleter(self.customerSuggestions, field)
+            completer.setCompletionRole(role)
+            completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+            completer.activated[QModelIndex].connect(self.fill_customer)
+            field.setCompleter(completer)
+            field.textEdited.connect(lambda _, field=field: self.queue_customer_lookup(field))
         
         self.paidAmountInput = QLineEdit(self)
         self.paidAmountInput.setPlaceholderText("Enter the amount paid")
         self.paidAmountInput.setToolTip("Enter the amount paid by the customer")
         self.paidAmountInput.setValidator(QDoubleValidator(0.0, 99999999.99, 2))
         self.paidAmountInput.setFont(common_font)
+        self.paidAmountInput.textChanged.connect(self.update_paid_amount)
         
         self.invoiceDetailsLayout.addRow('Date:', self.dateInput)
         self.invoiceDetailsLayout.addRow('Venue:', self.venueInput)
@@ -105,6 +254,21 @@ class InvoiceGenerator(QMainWindow):
         self.itemNameInput.setPlaceholderText("Enter item name")
         self.itemNameInput.setToolTip("Enter the name of the item")
         self.itemNameInput.setFont(common_font)
+
+        # Items invoiced before are suggested from memory as the name is
+        # typed; picking one fills in its last description and price. The
+        # catalog is loaded, and later refreshed, off the GUI thread.
+        self.itemCatalog = ItemCatalog()
+        self.catalogLookups = LookupQueue(self)
+        self.catalogLookups.finished.connect(self.catalog_refreshed)
+        self.refresh_catalog()
+        self.itemSuggestions = QStandardItemModel(self)
+        itemCompleter = QCompleter(self.itemSuggestions, self.itemNameInput)
+        itemCompleter.setCompletionRole(ITEM_ROLE)
+        itemCompleter.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        itemCompleter.activated[QModelIndex].connect(self.fill_item)
+        self.itemNameInput.setCompleter(itemCompleter)
+        self.itemNameInput.textEdited.connect(self.show_item_suggestions)
         
         self.itemDescriptionInput = QLineEdit(self)
         self.itemDescriptionInput.setPlaceholderText("Enter item description")
@@ -140,12 +304,22 @@ class InvoiceGenerator(QMainWindow):
         self.layout.addWidget(self.addItemButton)
         
         # Items Table
-        self.itemsTable = QTableWidget(0, 5)
-        self.itemsTable.setHorizontalHeaderLabels(['Name', 'Description', 'Price', 'Quantity', 'Total Price'])
+        self.itemsModel = LineItemsModel(self)
+        self.itemsModel.totalsChanged.connect(self.update_total_amount)
+        self.itemsTable = QTableView(self)
+        self.itemsTable.setModel(self.itemsModel)
+        self.itemsTable.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.itemsTable.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         self.itemsTable.setFont(common_font)
         self.layout.addWidget(self.itemsTable)
         
+        self.removeItemButton = QPushButton('Remove Item', self)
+        self.removeItemButton.setToolTip("Click to remove the selected items from the invoice")
+        self.removeItemButton.setFont(common_font)
+        self.removeItemButton.clicked.connect(self.remove_items)
+        
+        self.layout.addWidget(self.removeItemButton)
+        
         # Amount and Status Group
         self.amountStatusGroup = QGroupBox('Amount and Status')
         self.amountStatusGroup.setFont(QFont('Arial', 12, QFont.Bold))
@@ -188,6 +362,11 @@ class InvoiceGenerator(QMainWindow):
         self.layout.addWidget(self.buttonGroup)
         
         self.centralWidget.setLayout(self.layout)
+        
+        # Background PDF rendering
+        self.renderQueue = RenderQueue(self)
+        self.renderStatus = RenderStatus(self, self.renderQueue)
+        self.statusBar().addPermanentWidget(self.renderStatus)
 
     def add_item(self):
         name = self.itemNameInput.text()
@@ -196,207 +375,130 @@ class InvoiceGenerator(QMainWindow):
         quantity = self.itemQuantityInput.text()
         
         try:
-            price = float(price)
-            quantity = int(quantity)
-            total_price = price * quantity
-            
-            rowPosition = self.itemsTable.rowCount()
-            self.itemsTable.insertRow(rowPosition)
-            self.itemsTable.setItem(rowPosition, 0, QTableWidgetItem(name))
-            self.itemsTable.setItem(rowPosition, 1, QTableWidgetItem(description))
-            self.itemsTable.setItem(rowPosition, 2, QTableWidgetItem(f'{price:.2f}'))
-            self.itemsTable.setItem(rowPosition, 3, QTableWidgetItem(f'{quantity}'))
-            self.itemsTable.setItem(rowPosition, 4, QTableWidgetItem(f'{total_price:.2f}'))
-            
-            self.update_total_amount()
+            self.itemsModel.add_item(name, description, to_cents(price), int(quantity))
             self.clear_item_fields()
         except ValueError:
             QMessageBox.warning(self, 'Error', 'Please enter valid price and quantity.')
 
+    def remove_items(self):
+        rows = {index.row() for index in self.itemsTable.selectionModel().selectedRows()}
+        for row in sorted(rows, reverse=True):
+            self.itemsModel.remove_item(row)
+
+    def refresh_catalog(self):
+        self.catalogRefreshed = time.monotonic()
+        self.catalogLookups.submit(self.itemCatalog.refresh)
+
+    def catalog_refreshed(self, changed):
+        # Suggestions already showing may be missing the names just read
+        if changed and self.itemNameInput.hasFocus() and self.itemNameInput.text():
+            self.update_item_suggestions(self.itemNameInput.text())
+
+    def show_item_suggestions(self, text):
+        if time.monotonic() - self.catalogRefreshed >= CATALOG_REFRESH_SECONDS:
+            self.refresh_catalog()
+        self.update_item_suggestions(text)
+
+    def update_item_suggestions(self, text):
+        self.itemSuggestions.clear()
+        for name, description, price_cents in self.itemCatalog.suggest(text):
+            item = QStandardItem(f"{name}  ·  {format_cents(price_cents)}")
+            item.setData(name, ITEM_ROLE)
+            item.setData((description, price_cents), Qt.UserRole)
+            self.itemSuggestions.appendRow(item)
+        completer = self.itemNameInput.completer()
+        if self.itemSuggestions.rowCount():
+            completer.complete()
+        else:
+            completer.popup().hide()
+
+    def fill_item(self, index):
+        description, price_cents = index.data(Qt.UserRole)
+        self.itemNameInput.setText(index.data(ITEM_ROLE))
+        self.itemDescriptionInput.setText(description)
+        self.itemPriceInput.setText(format_cents(price_cents))
+
     def clear_item_fields(self):
         self.itemNameInput.clear()
         self.itemDescriptionInput.clear()
         self.itemPriceInput.clear()
         self.itemQuantityInput.clear()
         
+    def update_paid_amount(self, text):
+        try:
+            self.itemsModel.set_paid(to_cents(text))
+        except ValueError:
+            pass
+
     def update_total_amount(self):
-        total_amount = 0.0
-        for row in range(self.itemsTable.rowCount()):
-            try:
-                total_price = float(self.itemsTable.item(row, 4).text())
-                total_amount += total_price
-            except (ValueError, TypeError):
-                pass
-        self.totalAmountLabel.setText(f'Total Amount: {total_amount:.2f}')
+        items = self.itemsModel.items
+        self.totalAmountLabel.setText(f'Total Amount: {format_cents(items.total_cents)}')
+        self.remainingAmountLabel.setText(f'Remaining Amount: {format_cents(items.remaining_cents)}')
+        self.paidStatusLabel.setText(f'Paid Status: {items.paid_status}')
         
     def save_and_generate_pdf(self):
-        date = self.dateInput.text()
+        date = self.dateInput.date().toString(Qt.ISODate)
         venue = self.venueInput.text()
         customer_name = self.customerInput.text()
         customer_phone = self.phoneInput.text()
-        paid_amount = float(self.paidAmountInput.text())
-
-        total_amount = self.calculate_total_amount()
-        remaining_amount = total_amount - paid_amount
-        paid_status = "Paid" if remaining_amount == 0 else "Not Paid"
-
-        if date and venue and customer_name and customer_phone and self.itemsTable.rowCount() > 0:
-            conn = sqlite3.connect('invoices.db')
-            c = conn.cursor()
-            c.execute("""INSERT INTO invoices (date, venue, customer_name, customer_phone, total_amount, paid_amount, remaining_amount, paid_status)
-                         VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-                      (date, venue, customer_name, customer_phone, total_amount, paid_amount, remaining_amount, paid_status))
-            invoice_id = c.lastrowid
-
-            for row in range(self.itemsTable.rowCount()):
-                name = self.itemsTable.item(row, 0).text()
-                description = self.itemsTable.item(row, 1).text()
-                price = float(self.itemsTable.item(row, 2).text())
-                quantity = int(self.itemsTable.item(row, 3).text())
-                total_price = float(self.itemsTable.item(row, 4).text())
-                c.execute("""INSERT INTO invoice_items (invoice_id, name, description, price, quantity, total_price)
-                             VALUES (?, ?, ?, ?, ?, ?)""",
-                          (invoice_id, name, description, price, quantity, total_price))
-
-            conn.commit()
-            conn.close()
+        items = self.itemsModel.items
+
+        if date and venue and customer_name and customer_phone and len(items) > 0:
+            # Goes through the shared writer, which batches and retries
+            # saves from every window and front desk
+            try:
+                with metrics.span('save.insert'):
+                    invoice, rows = get_writer().insert_invoice(date, venue, customer_name, customer_phone,
+                                                                items.total_cents / 100, items.paid_cents / 100,
+                                                                items.remaining_cents / 100, items.paid_status,
+                                                                items.rows())
+            except (sqlite3.Error, OSError, EOFError) as e:
+                QMessageBox.warning(self, 'Error', f'The invoice could not be saved: {e}')
+                return
             QMessageBox.information(self, 'Success', 'Invoice saved successfully!')
+            # Its items are in the catalog now
+            self.refresh_catalog()
 
-            # Generate PDF using saved data
-            conn = sqlite3.connect('invoices.db')
-            c = conn.cursor()
-
-            # Fetch the latest invoice details
-            c.execute("SELECT * FROM invoices WHERE invoice_id = ?", (invoice_id,))
-            invoice = c.fetchone()
-
-            # Fetch items related to the invoice
-            c.execute("SELECT * FROM invoice_items WHERE invoice_id = ?", (invoice_id,))
-            items = c.fetchall()
-
-            conn.close()
-
-            # Generate PDF
-            pdf = CustomPDF()
-            pdf.add_page()
-
-            pdf.set_char_spacing(0)
-        
-            # Invoice Header
-            pdf.set_font("Helvetica", size=15, style='B')
-            pdf.set_fill_color(0, 0, 0)
-            pdf.set_text_color(255, 255, 255)
-            pdf.set_xy(x=0, y=5)
-            pdf.cell(210, 10, txt='INVOICE', align='C', fill=True)
-            
-            # Reset Colors
-            pdf.set_fill_color(255, 255, 255)
-            pdf.set_text_color(0, 0, 0)
-            
-            # Set Logo
-            pdf.image('logo_resized.png', x=10, y=20, w=50, h=35)
-            
-            pdf.set_font("Helvetica", size=14, style='B')
-            
-            # Align right with Logo
-            pdf.set_xy(x=120, y=30)
-            pdf.set_fill_color(238, 238, 238)
-            pdf.cell(30, 7, txt=f"Invoice ID:", ln=True, align='L', fill=True, border=1)
-            pdf.set_xy(x=150, y=30)
-            pdf.set_font("Helvetica", size=14, style='')
-            pdf.cell(40, 7, txt=f"{invoice[0]}", ln=True, align='L', border=1, fill=False)
-            pdf.set_xy(x=120, y=37)
-            pdf.set_font("Helvetica", size=14, style='B')
-            pdf.cell(30, 7, txt=f"Date:", ln=True, align='L', fill=True, border=1)
-            pdf.set_xy(x=150, y=37)
-            pdf.set_font("Helvetica", size=14, style='')
-            pdf.cell(40, 7, txt=f"{invoice[1]}", ln=True, align='L', border=1, fill=False)
-            pdf.set_xy(x=120, y=44)
-            pdf.set_font("Helvetica", size=14, style='B')
-            pdf.multi_cell(30, 7, txt=f"Venue:", ln=True, align='L', fill=True, border=1)
-            pdf.set_xy(x=150, y=44)
-            pdf.set_font("Helvetica", size=14, style='')
-            pdf.multi_cell(40, 7, txt=f"{invoice[2]}", ln=True, align='L', border=1, fill=False)
-            
-            pdf.set_font("Helvetica", size=10, style='')
-            
-            # Below Logo Customer Details
-            pdf.set_xy(x=7, y=81)
-            pdf.cell(43, 7, txt=f"Customer Name:", ln=True, align='L', fill=True, border=1)
-            pdf.set_xy(x=48, y=81)
-            pdf.cell(43, 7, txt=f"{invoice[3]}", ln=True, align='L', fill=True, border=1)
-            pdf.set_xy(x=7, y=88)
-            pdf.cell(43, 7, txt=f"Customer Phone:", ln=True, align='L', fill=True, border=1)
-            pdf.set_xy(x=48, y=88)
-            pdf.cell(43, 7, txt=f"{invoice[4]}", ln=True, align='L', fill=True, border=1)
-            # pdf.cell(200, 10, txt=f"Customer Phone: {invoice[4]}", ln=True, align='L')
-            # pdf.cell(200, 10, txt=f"Total Amount: {invoice[5]:.2f}", ln=True, align='L')
-                    
-            # Align right with Customer Details
-            pdf.set_xy(x=120, y=81)
-            pdf.set_fill_color(238, 238, 238)
-            pdf.cell(30, 7, txt=f"Account Title:", ln=True, align='L', fill=True, border=1)
-            pdf.set_xy(x=150, y=81)
-            pdf.cell(55, 7, txt=f"Rameez Ahmed", ln=True, align='L', border=1, fill=False)
-            pdf.set_xy(x=120, y=88)
-            pdf.cell(30, 7, txt=f"Account Number:", ln=True, align='L', fill=True, border=1)
-            pdf.set_xy(x=150, y=88)
-            pdf.cell(55, 7, txt=f"00207901029503", ln=True, align='L', border=1, fill=False)
-            pdf.set_xy(x=120, y=95)
-            pdf.cell(30, 7, txt=f"IBAN:", ln=True, align='L', fill=True, border=1)
-            pdf.set_xy(x=150, y=95)
-            pdf.cell(55, 7, txt=f"PK58HABB0000207901029503", ln=True, align='L', border=1, fill=False)
-            
-            pdf.cell(200, 10, txt="", ln=True, align='L')
-            
-            pdf.ln()
-            
-            pdf.set_x(x=5)
-            
-            pdf.multi_cell_row(5, 40, 10, ["Item Name", "Description", "Price", "Quantity", "Total Price"], to_fill=True)
-
-            pdf.set_font("Helvetica", size=11, style='')
-
-            for item in items:
-                pdf.set_x(x=5)
-                pdf.multi_cell_row(5, 40, 5, [item[2], item[3], f"{item[4]:.2f}", str(item[5]), f"{item[6]:.2f}"], to_fill=False)
-            
-            pdf.set_font("Helvetica", size=12)
-            
-            pdf.set_x(x=5)
-            pdf.multi_cell_row(5, 40, 10, ["", "", "", "Total Amount", f"{invoice[5]:.2f}"], to_fill=False)
-            pdf.multi_cell_row(5, 40, 10, ["", "", "", "Paid Amount", f"{invoice[6]:.2f}"], to_fill=False)
-            pdf.multi_cell_row(5, 40, 10, ["", "", "", "Remaining Amount", f"{invoice[7]:.2f}"], to_fill=False)
-            pdf.multi_cell_row(5, 40, 10, ["", "", "", "Paid Status", f"{invoice[8]}"], to_fill=False)
-            
-            pdf_name = f"invoices/invoice_{invoice_id}.pdf"
-
-            QMessageBox.information(self, 'PDF Generated', f'PDF file has been generated: {pdf_name}')
+            # Generate PDF using saved data, off the GUI thread
+            self.renderQueue.submit(invoice[0], INVOICE_DIR, invoice, rows)
             self.clear_form()
         else:
             QMessageBox.warning(self, 'Error', 'Please fill all fields.')
     
-    def calculate_total_amount(self):
-        total_amount = 0.0
-        for row in range(self.itemsTable.rowCount()):
-            try:
-                total_price = float(self.itemsTable.item(row, 4).text())
-                total_amount += total_price
-            except (ValueError, TypeError):
-                pass
-        return total_amount
-    
+    def queue_customer_lookup(self, field):
+        self.customerLookupField = field
+        self.customerLookupTimer.start()
+
+    def lookup_customers(self):
+        self.customerLookups.submit(customers.suggest, self.customerLookupField.text())
+
+    def show_customer_suggestions(self, rows):
+        self.customerSuggestions.clear()
+        for _, name, phone in rows or ():
+            item = QStandardItem(f"{name}  ·  {phone}")
+            item.setData(name, NAME_ROLE)
+            item.setData(phone, PHONE_ROLE)
+            self.customerSuggestions.appendRow(item)
+        field = self.customerLookupField
+        if rows and field.hasFocus():
+            field.completer().complete()
+
+    def fill_customer(self, index):
+        self.customerInput.setText(index.data(NAME_ROLE))
+        self.phoneInput.setText(index.data(PHONE_ROLE))
+
     def clear_form(self):
         self.dateInput.setDate(QDate.currentDate())
         self.venueInput.clear()
         self.customerInput.clear()
         self.phoneInput.clear()
         self.paidAmountInput.clear()
-        self.itemsTable.setRowCount(0)
-        self.totalAmountLabel.setText('Total Amount: 0.0')
-        self.remainingAmountLabel.setText('Remaining Amount: 0.0')
-        self.paidStatusLabel.setText('Paid Status: Not Paid')
+        self.itemsModel.clear()
     
+    def closeEvent(self, event):
+        self.renderStatus.shutdown()
+        super().closeEvent(event)
+
     def view_invoices(self):
         password, ok = QInputDialog.getText(self, 'Authentication', 'Enter password:', QLineEdit.Password)
         if ok and password == 'admin':  # Replace 'your_password' with the actual password
@@ -406,6 +508,180 @@ class InvoiceGenerator(QMainWindow):
             QMessageBox.warning(self, 'Error', 'Authentication failed')
 
 
+class InvoiceTableModel(QAbstractTableModel):
+    """Invoices fetched a page at a time as the view scrolls.
+
+    Filters and the sort order go into the SQL, and pages are read with
+    keyset pagination on the sort column and invoice_id, so every fetch is an
+    index seek no matter how deep the user has scrolled. Cell text is only
+    produced when the view asks for a visible cell.
+    """
+    HEADERS = [
+        'Invoice ID', 'Date', 'Venue', 'Customer Name',
+        'Customer Phone', 'Total Amount', 'Paid Amount',
+        'Remaining Amount', 'Paid Status'
+    ]
+    PAGE_SIZE = 256
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = []
+        self.exhausted = False
+        self.search_text = ''
+        self.filters = {}
+        # None keeps the natural order: by id, or best match first when searching
+        self.sort_column = None
+        self.descending = False
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and index.isValid():
+            return str(self.rows[index.row()][index.column()])
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted and not self.search_text
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        after = self.rows[-1] if self.rows else None
+        # A failed page stops paging, so the view does not retry it on every scroll
+        self.exhausted = True
+        with metrics.span('viewer.fetch_page'):
+            page = browse_invoices(self.filters, self.sort_key() or 'invoice_id', self.descending,
+                                   after, self.PAGE_SIZE)
+        self.exhausted = False
+        if len(page) < self.PAGE_SIZE:
+            self.exhausted = True
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(page) - 1)
+            self.rows.extend(page)
+            self.endInsertRows()
+
+    def reload(self):
+        self.beginResetModel()
+        self.rows = []
+        self.exhausted = False
+        self.endResetModel()
+
+    def sort_key(self):
+        return SORT_COLUMNS[self.sort_column] if self.sort_column is not None else None
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_column = column if column >= 0 else None
+        self.descending = order == Qt.DescendingOrder
+        self.refresh()
+
+    def set_query(self, text, filters):
+        """Show invoices matching ``filters``, limited to full-text matches for ``text`` if it is not empty."""
+        self.search_text = text.strip()
+        self.filters = filters
+        self.refresh()
+
+    def refresh(self):
+        if not self.search_text:
+            self.reload()
+            self.fetchMore()
+            return
+        rows = search_invoices(self.search_text, filters=self.filters,
+                               sort=self.sort_key(), descending=self.descending)
+        self.beginResetModel()
+        self.rows = rows
+        self.endResetModel()
+
+    def invoice_id(self, row):
+        return self.rows[row][0]
+
+    def reload_row(self, row):
+        """Re-read one invoice after it changed, keeping its place in the list."""
+        self.rows[row] = db.fetch_invoice(self.rows[row][0])[0]
+        self.dataChanged.emit(self.index(row, 0), self.index(row, self.columnCount() - 1))
+
+
+class PaymentDialog(QDialog):
+    """Payments made so far on one invoice, and a form to record the next one."""
+    HEADERS = ['Date', 'Amount', 'Method', 'Note']
+
+    def __init__(self, invoice_id, parent=None):
+        super().__init__(parent)
+        self.invoice_id = invoice_id
+        self.setWindowTitle(f'Payments for Invoice {invoice_id}')
+        self.resize(520, 420)
+
+        layout = QVBoxLayout()
+        self.balanceLabel = QLabel(self)
+        layout.addWidget(self.balanceLabel)
+
+        self.historyTable = QTableWidget(0, len(self.HEADERS), self)
+        self.historyTable.setHorizontalHeaderLabels(self.HEADERS)
+        self.historyTable.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.historyTable.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        layout.addWidget(self.historyTable)
+
+        form = QFormLayout()
+        self.amountInput = QLineEdit(self)
+        self.amountInput.setValidator(QDoubleValidator(0.0, 99999999.99, 2, self))
+        self.amountInput.setToolTip("Amount received; defaults to the whole remaining balance")
+        self.dateInput = QDateEdit(self)
+        self.dateInput.setCalendarPopup(True)
+        self.dateInput.setDisplayFormat('yyyy-MM-dd')
+        self.dateInput.setDate(QDate.currentDate())
+        self.methodInput = QComboBox(self)
+        self.methodInput.setEditable(True)
+        self.methodInput.addItems(payments.METHODS)
+        self.noteInput = QLineEdit(self)
+        self.noteInput.setPlaceholderText("e.g. balance after the event")
+        form.addRow('Amount:', self.amountInput)
+        form.addRow('Date:', self.dateInput)
+        form.addRow('Method:', self.methodInput)
+        form.addRow('Note:', self.noteInput)
+        layout.addLayout(form)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Cancel, self)
+        self.recordButton = buttons.addButton('Record Payment', QDialogButtonBox.AcceptRole)
+        buttons.accepted.connect(self.record)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+        self.setLayout(layout)
+
+        self.load()
+
+    def load(self):
+        total_cents, paid_cents, remaining_cents = payments.balance(self.invoice_id)
+        self.balanceLabel.setText(f"Total: {format_cents(total_cents)}    Paid: {format_cents(paid_cents)}    "
+                                  f"Remaining: {format_cents(remaining_cents)}")
+        self.amountInput.setText(format_cents(remaining_cents))
+        self.recordButton.setEnabled(remaining_cents > 0)
+
+        history = payments.payments_for(self.invoice_id)
+        self.historyTable.setRowCount(len(history))
+        for row, (_, _, date, amount_cents, method, note) in enumerate(history):
+            for column, text in enumerate((date, format_cents(amount_cents), method, note)):
+                self.historyTable.setItem(row, column, QTableWidgetItem(text))
+
+    def record(self):
+        try:
+            _, remaining_cents = get_writer().record_payment(
+                self.invoice_id, to_cents(self.amountInput.text()), self.dateInput.date().toString(Qt.ISODate),
+                self.methodInput.currentText().strip(), self.noteInput.text().strip())
+        except (ValueError, sqlite3.Error, OSError, EOFError) as e:
+            QMessageBox.warning(self, 'Error', str(e))
+            return
+        self.remaining_cents = remaining_cents
+        self.accept()
+
+
 class InvoiceViewer(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -420,205 +696,222 @@ class InvoiceViewer(QMainWindow):
         
         self.layout = QVBoxLayout()
         
-        self.tableWidget = QTableWidget()
-        self.layout.addWidget(self.tableWidget)
+        self.toolbarLayout = QHBoxLayout()
+        self.searchInput = QLineEdit(self)
+        self.searchInput.setPlaceholderText("Search customers, venues and items")
+        self.searchInput.setToolTip("Type to search; the best matches are listed first")
+        self.searchInput.setClearButtonEnabled(True)
+        self.toolbarLayout.addWidget(self.searchInput)
+        
+        # Wait for a pause in typing before querying
+        self.searchTimer = QTimer(self)
+        self.searchTimer.setSingleShot(True)
+        self.searchTimer.setInterval(250)
+        self.searchTimer.timeout.connect(self.run_search)
+        self.searchInput.textChanged.connect(self.searchTimer.start)
+        
+        self.paymentButton = QPushButton('Record Payment', self)
+        self.paymentButton.setToolTip("Record a payment against the selected invoice")
+        self.paymentButton.clicked.connect(self.record_payment)
+        self.toolbarLayout.addWidget(self.paymentButton)
+        
+        self.reportsButton = QPushButton('Reports', self)
+        self.reportsButton.setToolTip("Show totals per customer, month, venue and paid status")
+        self.reportsButton.clicked.connect(self.show_reports)
+        self.toolbarLayout.addWidget(self.reportsButton)
+        self.layout.addLayout(self.toolbarLayout)
+        
+        # Filters run as SQL; every change waits for the same typing pause as search
+        self.filterLayout = QHBoxLayout()
+        self.dateFromInput = self.date_filter("Only invoices on or after this date")
+        self.dateToInput = self.date_filter("Only invoices on or before this date")
+        self.statusInput = QComboBox(self)
+        self.statusInput.addItem('Any status')
+        self.statusInput.addItems(sorted(t.key for t in reports.totals('status') if t.key))
+        self.statusInput.setToolTip("Only invoices with this paid status")
+        self.statusInput.currentIndexChanged.connect(self.searchTimer.start)
+        self.customerFilterInput = QLineEdit(self)
+        self.customerFilterInput.setPlaceholderText("Customer name or phone")
+        self.customerFilterInput.setClearButtonEnabled(True)
+        self.customerFilterInput.textChanged.connect(self.searchTimer.start)
+        self.minBalanceInput = QLineEdit(self)
+        self.minBalanceInput.setPlaceholderText("Minimum balance")
+        self.minBalanceInput.setValidator(QDoubleValidator(0, 1e12, 2, self))
+        self.minBalanceInput.textChanged.connect(self.searchTimer.start)
+        self.archivedInput = QCheckBox('Include archived', self)
+        self.archivedInput.setToolTip("Also list old paid invoices that have been moved to the yearly archives")
+        self.archivedInput.stateChanged.connect(self.searchTimer.start)
+        
+        self.filterLayout.addWidget(QLabel('From:', self))
+        self.filterLayout.addWidget(self.dateFromInput)
+        self.filterLayout.addWidget(QLabel('To:', self))
+        self.filterLayout.addWidget(self.dateToInput)
+        self.filterLayout.addWidget(self.statusInput)
+        self.filterLayout.addWidget(self.customerFilterInput)
+        self.filterLayout.addWidget(self.minBalanceInput)
+        self.filterLayout.addWidget(self.archivedInput)
+        self.layout.addLayout(self.filterLayout)
+        
+        self.tableView = QTableView()
+        self.tableView.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.layout.addWidget(self.tableView)
         
         self.centralWidget.setLayout(self.layout)
         
+        self.renderQueue = RenderQueue(self)
+        self.renderStatus = RenderStatus(self, self.renderQueue)
+        self.statusBar().addPermanentWidget(self.renderStatus)
+        
         self.load_invoices()
 
     def load_invoices(self):
-        conn = sqlite3.connect('invoices.db')
-        c = conn.cursor()
-        c.execute("SELECT * FROM invoices")
-        invoices = c.fetchall()
+        with metrics.span('viewer.load_invoices'):
+            self.model = InvoiceTableModel(parent=self)
+            self.model.fetchMore()
+            self.tableView.setModel(self.model)
         
-        # Update the table widget to include new columns
-        self.tableWidget.setRowCount(len(invoices))
-        self.tableWidget.setColumnCount(9)
-        self.tableWidget.setHorizontalHeaderLabels([
-            'Invoice ID', 'Date', 'Venue', 'Customer Name', 
-            'Customer Phone', 'Total Amount', 'Paid Amount', 
-            'Remaining Amount', 'Paid Status'
-        ])
+        self.tableView.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        # Header clicks re-query in SQL through InvoiceTableModel.sort; no
+        # indicator at first so the natural order is kept
+        self.tableView.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.tableView.setSortingEnabled(True)
         
-        for row_num, row_data in enumerate(invoices):
-            for col_num, data in enumerate(row_data):
-                self.tableWidget.setItem(row_num, col_num, QTableWidgetItem(str(data)))
+        # Connect double-click event to the generate_pdf method
+        self.tableView.doubleClicked.connect(self.generate_pdf)
+
+    def date_filter(self, tooltip):
+        dateFilter = QDateEdit(self)
+        dateFilter.setCalendarPopup(True)
+        dateFilter.setDisplayFormat('yyyy-MM-dd')
+        # The minimum date stands for "no limit"
+        dateFilter.setMinimumDate(QDate(2000, 1, 1))
+        dateFilter.setSpecialValueText('Any')
+        dateFilter.setDate(dateFilter.minimumDate())
+        dateFilter.setToolTip(tooltip)
+        dateFilter.dateChanged.connect(self.searchTimer.start)
+        return dateFilter
+
+    def current_filters(self):
+        filters = {}
+        for key, dateFilter in (('date_from', self.dateFromInput), ('date_to', self.dateToInput)):
+            if dateFilter.date() != dateFilter.minimumDate():
+                filters[key] = dateFilter.date().toString(Qt.ISODate)
+        if self.statusInput.currentIndex() > 0:
+            filters['status'] = self.statusInput.currentText()
+        if self.customerFilterInput.text().strip():
+            filters['customer'] = self.customerFilterInput.text()
+        if self.minBalanceInput.text():
+            try:
+                filters['min_balance_cents'] = to_cents(self.minBalanceInput.text())
+            except ValueError:
+                pass
+        if self.archivedInput.isChecked():
+            filters['archived'] = True
+        return filters
+
+    def run_search(self):
+        try:
+            self.model.set_query(self.searchInput.text(), self.current_filters())
+        except (ValueError, sqlite3.Error) as e:
+            QMessageBox.warning(self, 'Search', f'The invoices could not be searched: {e}')
+
+    def record_payment(self):
+        rows = self.tableView.selectionModel().selectedRows()
+        if not rows:
+            QMessageBox.information(self, 'Record Payment', 'Select an invoice first')
+            return
+        row = rows[0].row()
+        invoice_id = self.model.invoice_id(row)
+        try:
+            dialog = PaymentDialog(invoice_id, self)
+        except LookupError:
+            QMessageBox.information(self, 'Record Payment', f'Invoice {invoice_id} is archived and fully paid')
+            return
+        if dialog.exec_() == QDialog.Accepted:
+            self.model.reload_row(row)
+            self.statusBar().showMessage(f'Payment recorded for invoice {invoice_id}; '
+                                         f'remaining {format_cents(dialog.remaining_cents)}', 10000)
+
+    def show_reports(self):
+        self.reportsWindow = ReportsWindow()
+        self.reportsWindow.show()
+
+    def generate_pdf(self, index):
+        with metrics.span('viewer.generate_pdf'):
+            invoice_id = self.model.invoice_id(index.row())
+            self.renderQueue.submit(invoice_id)
+
+    def closeEvent(self, event):
+        self.renderStatus.shutdown()
+        super().closeEvent(event)
+
+class ReportsWindow(QMainWindow):
+    def __init__(self):
+        super().__init__()
+        self.initUI()
+
+    def initUI(self):
+        self.setWindowTitle('Reports')
+        self.setGeometry(250, 250, 700, 500)
+        
+        self.centralWidget = QWidget()
+        self.setCentralWidget(self.centralWidget)
         
-        conn.close()
+        self.layout = QVBoxLayout()
         
-        self.tableWidget.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.summaryLabel = QLabel(self)
+        self.summaryLabel.setFont(QFont('Arial', 10))
+        self.layout.addWidget(self.summaryLabel)
         
-        # Connect double-click event to the generate_pdf method
-        self.tableWidget.itemDoubleClicked.connect(self.generate_pdf)
-
-
-    def generate_pdf(self, item):
-        row = item.row()
-        invoice_id = int(self.tableWidget.item(row, 0).text())
-        
-        conn = sqlite3.connect('invoices.db')
-        c = conn.cursor()
-        c.execute("SELECT * FROM invoices WHERE invoice_id = ?", (invoice_id,))
-        invoice = c.fetchone()
-        
-        c.execute("SELECT * FROM invoice_items WHERE invoice_id = ?", (invoice_id,))
-        items = c.fetchall()
-        conn.close()
-
-        pdf = CustomPDF()
-        pdf.add_page()
-        
-        pdf.set_char_spacing(0)
-        
-        # Invoice Header
-        pdf.set_font("Helvetica", size=15, style='B')
-        pdf.set_fill_color(0, 0, 0)
-        pdf.set_text_color(255, 255, 255)
-        pdf.set_xy(x=0, y=5)
-        pdf.cell(210, 10, txt='INVOICE', align='C', fill=True)
-        
-        # Reset Colors
-        pdf.set_fill_color(255, 255, 255)
-        pdf.set_text_color(0, 0, 0)
-        
-        # Set Logo
-        pdf.image('logo_resized.png', x=10, y=20, w=50, h=35)
-        
-        pdf.set_font("Helvetica", size=14, style='B')
-        
-        # Align right with Logo
-        pdf.set_xy(x=120, y=30)
-        pdf.set_fill_color(238, 238, 238)
-        pdf.cell(30, 7, txt=f"Invoice ID:", ln=True, align='L', fill=True, border=1)
-        pdf.set_xy(x=150, y=30)
-        pdf.set_font("Helvetica", size=14, style='')
-        pdf.cell(40, 7, txt=f"{invoice[0]}", ln=True, align='L', border=1, fill=False)
-        pdf.set_xy(x=120, y=37)
-        pdf.set_font("Helvetica", size=14, style='B')
-        pdf.cell(30, 7, txt=f"Date:", ln=True, align='L', fill=True, border=1)
-        pdf.set_xy(x=150, y=37)
-        pdf.set_font("Helvetica", size=14, style='')
-        pdf.cell(40, 7, txt=f"{invoice[1]}", ln=True, align='L', border=1, fill=False)
-        pdf.set_xy(x=120, y=44)
-        pdf.set_font("Helvetica", size=14, style='B')
-        pdf.multi_cell(30, 7, txt=f"Venue:", ln=True, align='L', fill=True, border=1)
-        pdf.set_xy(x=150, y=44)
-        pdf.set_font("Helvetica", size=14, style='')
-        pdf.multi_cell(40, 7, txt=f"{invoice[2]}", ln=True, align='L', border=1, fill=False)
-        
-        pdf.set_font("Helvetica", size=10, style='')
-        
-        # Below Logo Customer Details
-        pdf.set_xy(x=7, y=61)
-        pdf.cell(43, 7, txt=f"Customer Name:", ln=True, align='L', fill=True, border=1)
-        pdf.set_xy(x=48, y=61)
-        pdf.cell(43, 7, txt=f"{invoice[3]}", ln=True, align='L', fill=True, border=1)
-        pdf.set_xy(x=7, y=68)
-        pdf.cell(43, 7, txt=f"Customer Phone:", ln=True, align='L', fill=True, border=1)
-        pdf.set_xy(x=48, y=68)
-        pdf.cell(43, 7, txt=f"{invoice[4]}", ln=True, align='L', fill=True, border=1)
-        # pdf.cell(200, 10, txt=f"Customer Phone: {invoice[4]}", ln=True, align='L')
-        # pdf.cell(200, 10, txt=f"Total Amount: {invoice[5]:.2f}", ln=True, align='L')
-                
-        # Align right with Customer Details
-        pdf.set_xy(x=120, y=61)
-        pdf.set_fill_color(238, 238, 238)
-        pdf.cell(30, 7, txt=f"Account Title:", ln=True, align='L', fill=True, border=1)
-        pdf.set_xy(x=150, y=61)
-        pdf.cell(55, 7, txt=f"Rameez Ahmed", ln=True, align='L', border=1, fill=False)
-        pdf.set_xy(x=120, y=68)
-        pdf.cell(30, 7, txt=f"Account Number:", ln=True, align='L', fill=True, border=1)
-        pdf.set_xy(x=150, y=68)
-        pdf.cell(55, 7, txt=f"00207901029503", ln=True, align='L', border=1, fill=False)
-        pdf.set_xy(x=120, y=75)
-        pdf.cell(30, 7, txt=f"IBAN:", ln=True, align='L', fill=True, border=1)
-        pdf.set_xy(x=150, y=75)
-        pdf.cell(55, 7, txt=f"PK58HABB0000207901029503", ln=True, align='L', border=1, fill=False)
-        
-        # pdf.cell(200, 10, txt="", ln=True, align='L')
-        
-        pdf.ln()
-        
-        pdf.set_x(x=5)
-        
-        pdf.multi_cell_row(5, 40, 10, ["Item Name", "Description", "Price", "Quantity", "Total Price"], to_fill=True)
-
-        pdf.set_font("Helvetica", size=11, style='')
-
-        for item in items:
-            pdf.set_x(x=5)
-            pdf.multi_cell_row(5, 40, 5, [item[2], item[3], f"{item[4]:.2f}", str(item[5]), f"{item[6]:.2f}"], to_fill=False)
-        
-        pdf.set_font("Helvetica", size=12)
-        
-        pdf.set_x(x=5)
-        pdf.multi_cell_row(5, 40, 10, ["", "", "", "Total Amount", f"{invoice[5]:.2f}"], to_fill=False)
-        pdf.set_x(x=5)
-        pdf.multi_cell_row(5, 40, 10, ["", "", "", "Paid Amount", f"{invoice[6]:.2f}"], to_fill=False)
-        pdf.set_x(x=5)
-        pdf.multi_cell_row(5, 40, 10, ["", "", "", "Remaining Amount", f"{invoice[7]:.2f}"], to_fill=False)
-        pdf.set_x(x=5)
-        pdf.multi_cell_row(5, 40, 10, ["", "", "", "Paid Status", f"{invoice[8]}"], to_fill=False)
-        
-        pdf.ln()
-                
-        # Invoice Header
-        pdf.set_font("Helvetica", size=15, style='B')
-        pdf.cell(190, 10, txt='ADDITIONAL NOTES', align='C')
-        pdf.ln()
-        pdf.set_fill_color(0, 0, 0)
-        pdf.set_x(x=0)
-        pdf.cell(210, 0.5, txt='', align='C', fill=True)
-        pdf.ln()
-        pdf.ln()
-        
-        # Reset Colors
-        pdf.set_fill_color(255, 255, 255)
-        
-        pdf.set_x(x=2)
-        pdf.set_font("Helvetica", size=12, style='B')
-        pdf.cell(w=200, h=6, txt="Payment Terms:")
-        pdf.ln()
-        
-        pdf.set_font("Helvetica", size=10, style='')
-        pdf.set_x(x=10)
-        pdf.multi_cell(w=200, h=4, txt="- A 50% advance will be given before the event, and the remaining payment will be cleared by the next day of the event. Otherwise, raw data will not be provided for selection.")
-        pdf.ln()
-        
-        pdf.set_x(x=2)
-        pdf.set_font("Helvetica", size=12, style='B')
-        pdf.cell(w=200, h=4, txt="Terms and Conditions:")
-        pdf.ln()
-        
-        pdf.set_font("Helvetica", size=10, style='')
-        pdf.set_x(x=10)
-        pdf.multi_cell(w=200, h=4, txt='- No payment will be refunded in case of any mishap or unforeseen situation / circumstances occurred.')
-        pdf.ln(1)
-        pdf.multi_cell(w=200, h=4, txt='- Client can only provide the extended date of the event.')
-        pdf.ln(1)
-        pdf.multi_cell(w=200, h=4, txt='- Misbehavior of client will not be accepted')
-        pdf.ln(1)
-        pdf.multi_cell(w=200, h=4, txt="- If photographer provides any suggestion / advice regarding event management and client don't listen or take it seriously so it will be not our responsibility.")
-        pdf.ln(1)
-        pdf.multi_cell(w=200, h=4, txt='- Client Pictures will be used on our page regarding marketing purposes at Instagram and Facebook.')
-        pdf.ln(1)
-        pdf.multi_cell(w=200, h=4, txt='- Ask for update on editing after 15 days of the event.')
-        pdf.ln(1)
-        pdf.multi_cell(w=200, h=4, txt='Kindly read this E-mail and instructions carefully and reply back to this but E-mail for confirmation. If any query so please contact us on:')
-        pdf.ln(1)
-        pdf.multi_cell(w=200, h=4, txt='+923142179245')        
-        
-        pdf_name = f"duplicate_invoices/invoice_{invoice_id}.pdf"
-        pdf.output(pdf_name)
-        
-        QMessageBox.information(self, 'PDF Generated', f'PDF file has been generated: {pdf_name}')
+        self.tabs = QTabWidget(self)
+        self.layout.addWidget(self.tabs)
+        
+        self.centralWidget.setLayout(self.layout)
+        
+        self.load_reports()
+
+    def load_reports(self):
+        summary = reports.dashboard()
+        self.summaryLabel.setText(
+            f"Invoices: {summary['invoice_count']}    "
+            f"Total: {format_cents(summary['total_cents'])}    "
+            f"Paid: {format_cents(summary['paid_cents'])}    "
+            f"Outstanding: {format_cents(summary['outstanding_cents'])}    "
+            f"Unpaid invoices: {summary['unpaid_count']}")
+        
+        self.tabs.clear()
+        self.add_tab('Outstanding by Customer', 'Customer Phone', reports.outstanding_by_customer())
+        self.add_tab('Revenue by Month', 'Month', reports.revenue_by_month())
+        self.add_tab('Revenue by Venue', 'Venue', reports.revenue_by_venue())
+        self.add_tab('By Paid Status', 'Paid Status', reports.totals('status'))
+
+    def add_tab(self, title, key_header, rows):
+        table = QTableWidget(len(rows), 5)
+        table.setHorizontalHeaderLabels([key_header, 'Invoices', 'Total Amount', 'Paid Amount', 'Remaining Amount'])
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        for row_num, totals in enumerate(rows):
+            for col_num, text in enumerate((totals.key, str(totals.invoice_count), format_cents(totals.total_cents),
+                                            format_cents(totals.paid_cents), format_cents(totals.remaining_cents))):
+                table.setItem(row_num, col_num, QTableWidgetItem(text))
+        self.tabs.addTab(table, title)
+
 
 if __name__ == '__main__':
-    password, ok = QInputDialog.getText('Authentication', 'Enter password:', QLineEdit.Password)
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument('--metrics', help='record phase timings and write them here on exit (.prom or .jsonl)')
+    options.add_argument('--profile', help='write cProfile stats for the whole session here')
+    args, qt_args = options.parse_known_args()
+    if args.metrics:
+        metrics.enable(args.metrics)
+    if args.profile:
+        metrics.start_profile(args.profile)
+    sys.argv = sys.argv[:1] + qt_args
+
+    # Every widget, the password dialog included, needs the QApplication first
+    app = QApplication(sys.argv)
+    password, ok = QInputDialog.getText(None, 'Authentication', 'Enter password:', QLineEdit.Password)
     if ok and password == 'admin':  # Replace 'your_password' with the actual password
-        app = QApplication(sys.argv)
         ex = InvoiceGenerator()
         ex.show()
         sys.exit(app.exec_())
@@ -0,0 +1,167 @@
+import atexit
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# cProfile, pstats and json are imported where they are used so that every
+# instrumented module can import this one for free
+
+# Histogram bucket upper bounds in seconds, Prometheus style
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_enabled = False
+_histograms = {}
+_lock = threading.Lock()
+_noop = nullcontext()
+
+_profile_path = None
+_profiles = []
+
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'total')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        i = 0
+        while i < len(BUCKETS) and seconds > BUCKETS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += seconds
+
+
+class _Span:
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.started)
+        return False
+
+
+def span(name):
+    """Time a ``with`` block into the ``name`` histogram.
+
+    While metrics are off this returns one shared no-op context manager, so
+    an instrumented block costs a global lookup and a call.
+    """
+    if not _enabled:
+        return _noop
+    return _Span(name)
+
+
+def observe(name, seconds):
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+
+def snapshot():
+    """``{name: (bucket counts, count, total seconds)}`` of everything recorded so far."""
+    with _lock:
+        return {name: (list(h.counts), h.count, h.total) for name, h in _histograms.items()}
+
+
+def enabled():
+    return _enabled
+
+
+def enable(path=None):
+    """Start recording spans; with ``path``, dump them there when the process exits."""
+    global _enabled
+    _enabled = True
+    if path:
+        atexit.register(dump, path)
+
+
+def dump(path):
+    """Write all histograms to ``path``: Prometheus text for a .prom file, else one JSONL line per span.
+
+    A .prom file is overwritten, so processes sharing one path (batch
+    render workers) should use JSONL, which is appended and tagged by pid.
+    """
+    import json
+
+    data = snapshot()
+    if path.endswith('.prom'):
+        lines = ['# HELP invoice_span_seconds Time spent in instrumented phases.',
+                 '# TYPE invoice_span_seconds histogram']
+        for name, (counts, count, total) in sorted(data.items()):
+            running = 0
+            for bound, bucket in zip([repr(b) for b in BUCKETS] + ['+Inf'], counts):
+                running += bucket
+                lines.append(f'invoice_span_seconds_bucket{{span="{name}",le="{bound}"}} {running}')
+            lines.append(f'invoice_span_seconds_sum{{span="{name}"}} {total}')
+            lines.append(f'invoice_span_seconds_count{{span="{name}"}} {count}')
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+    else:
+        # Appended, so every session of the app adds its own lines
+        now = time.time()
+        with open(path, 'a') as f:
+            for name, (counts, count, total) in sorted(data.items()):
+                f.write(json.dumps({'time': now, 'pid': os.getpid(), 'span': name, 'count': count,
+                                    'sum_seconds': total, 'buckets': list(BUCKETS), 'counts': counts}) + '\n')
+
+
+def start_profile(path):
+    """cProfile this thread, and every profiled() block on others, until exit; stats go to ``path``."""
+    import cProfile
+    import pstats
+
+    global _profile_path
+    _profile_path = path
+    profile = cProfile.Profile()
+    profile.enable()
+
+    def finish():
+        profile.disable()
+        _profiles.append(profile)
+        stats = pstats.Stats(_profiles[0])
+        for other in _profiles[1:]:
+            stats.add(other)
+        stats.dump_stats(path)
+    atexit.register(finish)
+
+
+@contextmanager
+def profiled():
+    """Profile the block when start_profile() is active; cProfile only sees its own thread."""
+    if _profile_path is None:
+        yield
+        return
+    import cProfile
+
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Python 3.12+ allows a single active profiler per process
+        yield
+        return
+    try:
+        yield
+    finally:
+        profile.disable()
+        with _lock:
+            _profiles.append(profile)
+
+
+# Command line tools and pool worker processes pick the settings up from
+# the environment, so a whole batch can be measured without code changes
+if os.environ.get('INVOICES_METRICS'):
+    enable(os.environ['INVOICES_METRICS'])
@@ -0,0 +1,395 @@
+# Schema changes, oldest first. The position of a migration in MIGRATIONS is
+# its version number (starting at 1) and the database records the last one
+# applied in PRAGMA user_version, so only append to this list.
+
+
+def create_base_tables(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS invoices
+                 (invoice_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  date TEXT,
+                  venue TEXT,
+                  customer_name TEXT,
+                  customer_phone TEXT,
+                  total_amount REAL,
+                  paid_amount REAL,
+                  remaining_amount REAL,
+                  paid_status TEXT)''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS invoice_items
+                 (item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  invoice_id INTEGER,
+                  name TEXT,
+                  description TEXT,
+                  price REAL,
+                  quantity INTEGER,
+                  total_price REAL,
+                  FOREIGN KEY(invoice_id) REFERENCES invoices(invoice_id))''')
+
+
+def add_payment_columns(c):
+    # Databases created before the payment columns existed; this used to be
+    # the job of alter_table.py
+    columns = {row[1] for row in c.execute("PRAGMA table_info(invoices)")}
+    if 'paid_amount' not in columns:
+        c.execute("ALTER TABLE invoices ADD COLUMN paid_amount REAL DEFAULT 0")
+    if 'remaining_amount' not in columns:
+        c.execute("ALTER TABLE invoices ADD COLUMN remaining_amount REAL DEFAULT 0")
+    if 'paid_status' not in columns:
+        c.execute("ALTER TABLE invoices ADD COLUMN paid_status TEXT DEFAULT 'Unpaid'")
+
+
+def add_lookup_indexes(c):
+    c.execute("CREATE INDEX IF NOT EXISTS idx_invoice_items_invoice_id ON invoice_items(invoice_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_invoices_customer_phone ON invoices(customer_phone)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_invoices_paid_status ON invoices(paid_status)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_invoices_date ON invoices(date)")
+
+
+def create_import_checkpoints(c):
+    # One row per bulk import source, updated in the same transaction as each
+    # chunk it covers so an interrupted import knows where to pick up
+    c.execute('''CREATE TABLE IF NOT EXISTS import_checkpoints
+                 (source TEXT PRIMARY KEY,
+                  records_done INTEGER NOT NULL,
+                  updated_at TEXT NOT NULL)''')
+
+
+# Reporting dimensions kept in summary_totals: name -> key expression, with
+# {row} standing for NEW or OLD inside the triggers. Months are YYYY-MM from
+# either ISO dates or the M/D/YYYY text QDateEdit produced.
+SUMMARY_DIMENSIONS = {
+    'customer': "COALESCE({row}.customer_phone, '')",
+    'venue': "COALESCE({row}.venue, '')",
+    'status': "COALESCE({row}.paid_status, '')",
+    'month': """CASE
+                    WHEN {row}.date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]*' THEN substr({row}.date, 1, 7)
+                    WHEN {row}.date GLOB '*[0-9]/*[0-9]/[0-9][0-9][0-9][0-9]'
+                        THEN printf('%s-%02d', substr({row}.date, -4), CAST({row}.date AS INTEGER))
+                    ELSE ''
+                END""",
+}
+
+
+def _cents(expr):
+    return f"CAST(ROUND(COALESCE({expr}, 0) * 100) AS INTEGER)"
+
+
+def _summary_upsert(dimension, row, sign):
+    key = SUMMARY_DIMENSIONS[dimension].format(row=row)
+    return f"""INSERT INTO summary_totals (dimension, key, invoice_count, total_cents, paid_cents, remaining_cents)
+               VALUES ('{dimension}', {key}, {sign}1, {sign}{_cents(row + '.total_amount')},
+                       {sign}{_cents(row + '.paid_amount')}, {sign}{_cents(row + '.remaining_amount')})
+               ON CONFLICT(dimension, key) DO UPDATE SET
+                   invoice_count = invoice_count + excluded.invoice_count,
+                   total_cents = total_cents + excluded.total_cents,
+                   paid_cents = paid_cents + excluded.paid_cents,
+                   remaining_cents = remaining_cents + excluded.remaining_cents;"""
+
+
+def create_summary_totals(c):
+    # Running totals per customer, venue, paid status and month, kept current
+    # by triggers so reports read a handful of rows instead of every invoice
+    c.execute('''CREATE TABLE IF NOT EXISTS summary_totals
+                 (dimension TEXT NOT NULL,
+                  key TEXT NOT NULL,
+                  invoice_count INTEGER NOT NULL DEFAULT 0,
+                  total_cents INTEGER NOT NULL DEFAULT 0,
+                  paid_cents INTEGER NOT NULL DEFAULT 0,
+                  remaining_cents INTEGER NOT NULL DEFAULT 0,
+                  PRIMARY KEY (dimension, key)) WITHOUT ROWID''')
+
+    add_new = "\n".join(_summary_upsert(dimension, 'NEW', '') for dimension in SUMMARY_DIMENSIONS)
+    remove_old = "\n".join(_summary_upsert(dimension, 'OLD', '-') for dimension in SUMMARY_DIMENSIONS)
+
+    c.execute("DROP TRIGGER IF EXISTS summary_totals_insert")
+    c.execute("DROP TRIGGER IF EXISTS summary_totals_delete")
+    c.execute("DROP TRIGGER IF EXISTS summary_totals_update")
+    c.execute(f"CREATE TRIGGER summary_totals_insert AFTER INSERT ON invoices BEGIN {add_new} END")
+    c.execute(f"CREATE TRIGGER summary_totals_delete AFTER DELETE ON invoices BEGIN {remove_old} END")
+    c.execute(f"""CREATE TRIGGER summary_totals_update
+                  AFTER UPDATE OF date, venue, customer_phone, total_amount, paid_amount, remaining_amount, paid_status
+                  ON invoices BEGIN {remove_old} {add_new} END""")
+
+    # Backfill from the invoices that already exist
+    c.execute("DELETE FROM summary_totals")
+    for dimension, key in SUMMARY_DIMENSIONS.items():
+        key = key.format(row='invoices')
+        c.execute(f"""INSERT INTO summary_totals (dimension, key, invoice_count, total_cents, paid_cents, remaining_cents)
+                      SELECT '{dimension}', {key}, COUNT(*), SUM({_cents('total_amount')}),
+                             SUM({_cents('paid_amount')}), SUM({_cents('remaining_amount')})
+                      FROM invoices GROUP BY 2""")
+
+
+def create_search_index(c):
+    # External-content FTS5 indexes: the text stays in invoices/invoice_items
+    # and only the index is stored. Items get their own index so adding an
+    # item never re-tokenizes the rest of its invoice.
+    c.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS invoice_search USING fts5(
+                     customer_name, venue,
+                     content='invoices', content_rowid='invoice_id', tokenize='unicode61 remove_diacritics 2')""")
+    c.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS item_search USING fts5(
+                     name, description,
+                     content='invoice_items', content_rowid='item_id', tokenize='unicode61 remove_diacritics 2')""")
+
+    for table, index, key, columns in (('invoices', 'invoice_search', 'invoice_id', ('customer_name', 'venue')),
+                                       ('invoice_items', 'item_search', 'item_id', ('name', 'description'))):
+        names = ', '.join(columns)
+        new = ', '.join(f'NEW.{column}' for column in columns)
+        old = ', '.join(f'OLD.{column}' for column in columns)
+        insert = f"INSERT INTO {index} (rowid, {names}) VALUES (NEW.{key}, {new});"
+        delete = f"INSERT INTO {index} ({index}, rowid, {names}) VALUES ('delete', OLD.{key}, {old});"
+
+        for event in ('insert', 'delete', 'update'):
+            c.execute(f"DROP TRIGGER IF EXISTS {index}_{event}")
+        c.execute(f"CREATE TRIGGER {index}_insert AFTER INSERT ON {table} BEGIN {insert} END")
+        c.execute(f"CREATE TRIGGER {index}_delete AFTER DELETE ON {table} BEGIN {delete} END")
+        c.execute(f"CREATE TRIGGER {index}_update AFTER UPDATE OF {names} ON {table} BEGIN {delete} {insert} END")
+
+        c.execute(f"INSERT INTO {index} ({index}) VALUES ('rebuild')")
+
+
+def create_render_cache(c):
+    # Index of rendered PDFs in the render cache directory, keyed by a hash
+    # of everything that goes into the PDF. Editing or deleting an invoice
+    # marks its entries stale so eviction can reclaim their files; inserts
+    # need no trigger since a new invoice cannot have been rendered yet.
+    c.execute('''CREATE TABLE IF NOT EXISTS render_cache
+                 (key TEXT PRIMARY KEY,
+                  invoice_id INTEGER NOT NULL,
+                  size INTEGER NOT NULL,
+                  last_used REAL NOT NULL,
+                  stale INTEGER NOT NULL DEFAULT 0)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_render_cache_invoice ON render_cache (invoice_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_render_cache_last_used ON render_cache (stale, last_used)")
+
+    stale = "UPDATE render_cache SET stale = 1 WHERE invoice_id = OLD.invoice_id;"
+    for table, event in (('invoices', 'update'), ('invoices', 'delete'),
+                         ('invoice_items', 'update'), ('invoice_items', 'delete')):
+        name = f"render_cache_{table}_{event}"
+        c.execute(f"DROP TRIGGER IF EXISTS {name}")
+        c.execute(f"CREATE TRIGGER {name} AFTER {event.upper()} ON {table} BEGIN {stale} END")
+
+
+def _is_date(iso):
+    # date() takes any day up to 31 as it is; going through julianday rolls
+    # 2024-02-30 over into March, so only a real date comes back unchanged
+    return f"date(julianday({iso})) = {iso}"
+
+
+def convert_dates_to_iso(c):
+    # Dates used to be stored as QDateEdit.text(), M/D/YYYY in the locale
+    # the app shipped with (M/D/YY on some systems). YYYY-MM-DD sorts and
+    # range-queries as text. A date whose first part cannot be a month was
+    # written D/M by another locale and is read that way; anything that is
+    # a valid date in neither order is left as it is.
+    first = "CAST(date AS INTEGER)"
+    second = "CAST(substr(date, instr(date, '/') + 1) AS INTEGER)"
+    long_year = ("CAST(substr(date, -4) AS INTEGER)", "'[0-9]*/[0-9]*/[0-9][0-9][0-9][0-9]'")
+    short_year = ("2000 + CAST(substr(date, -2) AS INTEGER)", "'[0-9]*/[0-9]*/[0-9][0-9]'")
+
+    def convert(year, pattern, month, day):
+        iso = f"printf('%04d-%02d-%02d', {year}, {month}, {day})"
+        c.execute(f"UPDATE invoices SET date = {iso} WHERE date GLOB {pattern} AND {_is_date(iso)}")
+
+    # summary_totals already files M/D/YYYY dates under their month, so it
+    # needs no update for those; skipping its trigger saves a delete and
+    # insert per row. Every other conversion moves the row to a new month.
+    trigger = c.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'summary_totals_update'").fetchone()
+    c.execute("DROP TRIGGER IF EXISTS summary_totals_update")
+    convert(*long_year, first, second)
+    if trigger:
+        c.execute(trigger[0])
+    convert(*short_year, first, second)
+    # What is left with a valid D/M reading has a first part over 12
+    convert(*long_year, second, first)
+    convert(*short_year, second, first)
+
+    # Keyset pagination compares (column, invoice_id) pairs, which never
+    # match a NULL, so rows from before the payment columns get real values
+    c.execute("UPDATE invoices SET paid_amount = 0 WHERE paid_amount IS NULL")
+    c.execute("UPDATE invoices SET remaining_amount = total_amount - paid_amount WHERE remaining_amount IS NULL")
+    for column in ('date', 'venue', 'customer_name', 'customer_phone', 'paid_status'):
+        c.execute(f"UPDATE invoices SET {column} = '' WHERE {column} IS NULL")
+
+    # One index per sortable column that lacks one, so sorted pages are index range scans
+    for column in ('venue', 'customer_name', 'total_amount', 'paid_amount', 'remaining_amount'):
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_invoices_{column} ON invoices({column})")
+
+
+def create_payments(c):
+    # Amounts are kept as integer cents next to the REAL columns, which stay
+    # as a copy for the PDF layout and existing queries. Every payment is a
+    # row in payments; recording one adds it to the invoice's cents columns
+    # in the same transaction instead of summing the ledger again.
+    columns = {row[1] for row in c.execute("PRAGMA table_info(invoices)")}
+    for column in ('total_cents', 'paid_cents', 'remaining_cents'):
+        if column not in columns:
+            c.execute(f"ALTER TABLE invoices ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+    c.execute(f"""UPDATE invoices SET total_cents = {_cents('total_amount')}, paid_cents = {_cents('paid_amount')},
+                                      remaining_cents = {_cents('total_amount')} - {_cents('paid_amount')}""")
+    # Some early rows have a remaining amount that disagrees with total - paid;
+    # the ledger treats total - paid as the truth from here on
+    c.execute(f"""UPDATE invoices SET remaining_amount = remaining_cents / 100.0,
+                                      paid_status = CASE WHEN remaining_cents = 0 THEN 'Paid' ELSE 'Not Paid' END
+                  WHERE {_cents('remaining_amount')} != remaining_cents""")
+
+    c.execute('''CREATE TABLE IF NOT EXISTS payments
+                 (payment_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  invoice_id INTEGER NOT NULL,
+                  date TEXT NOT NULL,
+                  amount_cents INTEGER NOT NULL,
+                  method TEXT NOT NULL DEFAULT '',
+                  note TEXT NOT NULL DEFAULT '',
+                  FOREIGN KEY(invoice_id) REFERENCES invoices(invoice_id))''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_payments_invoice_id ON payments(invoice_id)")
+    # Only invoices with something left to pay, so outstanding lists read a
+    # small index however many invoices are settled
+    c.execute("CREATE INDEX IF NOT EXISTS idx_invoices_outstanding ON invoices(remaining_cents) WHERE remaining_cents > 0")
+
+    # The amount paid when the invoice was made becomes its first payment,
+    # whichever code path inserts the invoice
+    opening = """INSERT INTO payments (invoice_id, date, amount_cents, method, note)
+                 VALUES (NEW.invoice_id, NEW.date, NEW.paid_cents, '', 'Paid with booking');"""
+    c.execute("DROP TRIGGER IF EXISTS payments_opening")
+    c.execute(f"CREATE TRIGGER payments_opening AFTER INSERT ON invoices WHEN NEW.paid_cents > 0 BEGIN {opening} END")
+    c.execute("""INSERT INTO payments (invoice_id, date, amount_cents, method, note)
+                 SELECT invoice_id, date, paid_cents, '', 'Paid with booking' FROM invoices
+                 WHERE paid_cents > 0 AND invoice_id NOT IN (SELECT invoice_id FROM payments)""")
+
+
+# Delete triggers that must not fire when archive.py moves an invoice out
+# of the hot database: the invoice still exists, so reports keep its
+# totals, search keeps its index entries and the render cache its PDF
+ARCHIVE_SKIPPED_TRIGGERS = ('summary_totals_delete', 'invoice_search_delete', 'item_search_delete',
+                            'render_cache_invoices_delete', 'render_cache_invoice_items_delete')
+NOT_ARCHIVING = "WHEN NOT EXISTS (SELECT 1 FROM archiving)"
+
+
+def create_archive_support(c):
+    # archiving holds a row only inside an archive transaction, so no other
+    # connection ever sees one; archived_invoices says which year's archive
+    # file each moved invoice went to
+    c.execute("CREATE TABLE IF NOT EXISTS archiving (active INTEGER)")
+    c.execute('''CREATE TABLE IF NOT EXISTS archived_invoices
+                 (invoice_id INTEGER PRIMARY KEY,
+                  year TEXT NOT NULL)''')
+    for name in ARCHIVE_SKIPPED_TRIGGERS:
+        row = c.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (name,)).fetchone()
+        if row and NOT_ARCHIVING not in row[0]:
+            c.execute(f"DROP TRIGGER {name}")
+            c.execute(row[0].replace(' BEGIN ', f' {NOT_ARCHIVING} BEGIN ', 1))
+
+
+def create_export_checkpoints(c):
+    # The last invoice each named incremental line export has written, so
+    # the next run starts after it
+    c.execute('''CREATE TABLE IF NOT EXISTS export_checkpoints
+                 (name TEXT PRIMARY KEY,
+                  last_invoice_id INTEGER NOT NULL,
+                  updated_at TEXT NOT NULL)''')
+
+
+def create_customers(c):
+    # One row per phone number, named after the customer's latest invoice.
+    # NOCASE on name lets one index answer case-insensitive prefix lookups.
+    c.execute('''CREATE TABLE IF NOT EXISTS customers
+                 (customer_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  name TEXT NOT NULL COLLATE NOCASE,
+                  phone TEXT NOT NULL UNIQUE)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_customers_name ON customers(name)")
+    # The bare customer_name comes from the row with MAX(invoice_id)
+    c.execute("""INSERT OR IGNORE INTO customers (name, phone)
+                 SELECT customer_name, customer_phone FROM
+                 (SELECT customer_name, customer_phone, MAX(invoice_id) FROM invoices
+                  WHERE customer_phone != '' GROUP BY customer_phone)""")
+
+    columns = {row[1] for row in c.execute("PRAGMA table_info(invoices)")}
+    if 'customer_id' not in columns:
+        c.execute("ALTER TABLE invoices ADD COLUMN customer_id INTEGER REFERENCES customers(customer_id)")
+    c.execute("""UPDATE invoices SET customer_id = (SELECT customer_id FROM customers WHERE phone = invoices.customer_phone)
+                 WHERE customer_id IS NULL""")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_invoices_customer_id ON invoices(customer_id)")
+
+
+def create_item_catalog(c):
+    # Every item name ever invoiced with its latest description and price.
+    # version orders changes so catalog.ItemCatalog can read just the rows
+    # changed since it last looked.
+    c.execute('''CREATE TABLE IF NOT EXISTS item_catalog
+                 (name TEXT PRIMARY KEY COLLATE NOCASE,
+                  description TEXT NOT NULL DEFAULT '',
+                  price_cents INTEGER NOT NULL DEFAULT 0,
+                  version INTEGER NOT NULL DEFAULT 0)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_item_catalog_version ON item_catalog(version)")
+    # The bare description and price come from the row with MAX(item_id)
+    c.execute("""INSERT OR IGNORE INTO item_catalog (name, description, price_cents, version)
+                 SELECT name, COALESCE(description, ''), CAST(ROUND(price * 100) AS INTEGER), 1 FROM
+                 (SELECT name, description, price, MAX(item_id) FROM invoice_items
+                  WHERE trim(name) != '' GROUP BY name COLLATE NOCASE)""")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS item_catalog_insert AFTER INSERT ON invoice_items
+                 WHEN trim(NEW.name) != '' BEGIN
+                     INSERT INTO item_catalog (name, description, price_cents, version)
+                     VALUES (NEW.name, COALESCE(NEW.description, ''), CAST(ROUND(NEW.price * 100) AS INTEGER),
+                             (SELECT COALESCE(MAX(version), 0) + 1 FROM item_catalog))
+                     ON CONFLICT(name) DO UPDATE SET description = excluded.description,
+                                                     price_cents = excluded.price_cents,
+                                                     version = excluded.version;
+                 END""")
+
+
+def repair_day_first_dates(c):
+    # convert_dates_to_iso used to read every slash date as M/D, so a D/M
+    # date like 25/06/2024 became 2024-25-06. Read those as D/M, as it does now.
+    swapped = "printf('%s-%s-%s', substr(date, 1, 4), substr(date, 9, 2), substr(date, 6, 2))"
+    c.execute(f"""UPDATE invoices SET date = {swapped}
+                  WHERE date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+                  AND CAST(substr(date, 6, 2) AS INTEGER) BETWEEN 13 AND 31 AND {_is_date(swapped)}""")
+
+
+MIGRATIONS = [
+    create_base_tables,
+    add_payment_columns,
+    add_lookup_indexes,
+    create_import_checkpoints,
+    create_summary_totals,
+    create_search_index,
+    create_render_cache,
+    convert_dates_to_iso,
+    create_payments,
+    create_archive_support,
+    create_export_checkpoints,
+    create_customers,
+    create_item_catalog,
+    repair_day_first_dates,
+]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, migrations=MIGRATIONS):
+    """Bring the database up to the latest schema version and return it.
+
+    Every migration runs in its own transaction together with the version
+    bump, so a failed migration leaves the database at the previous version
+    and running this again is always safe.
+    """
+    if conn.in_transaction:
+        conn.commit()
+
+    while schema_version(conn) < len(migrations):
+        # Take the write lock before re-reading the version so two processes
+        # starting at once cannot both apply the same migration
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = schema_version(conn)
+            if version < len(migrations):
+                migrations[version](conn.cursor())
+                conn.execute(f"PRAGMA user_version = {version + 1}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    return schema_version(conn)
@@ -0,0 +1,69 @@
+from datetime import date as Date
+
+import db
+
+# Recording a payment adds it to the one invoice row in the same statement
+# that checks the balance, so no ledger is ever summed and two windows paying
+# the same invoice cannot both take it below zero. The REAL columns follow
+# the cents columns for the PDF layout; summary_totals and the render cache
+# pick the change up through their triggers.
+APPLY_PAYMENT = """UPDATE invoices
+                   SET paid_cents = paid_cents + :amount,
+                       remaining_cents = remaining_cents - :amount,
+                       paid_amount = (paid_cents + :amount) / 100.0,
+                       remaining_amount = (remaining_cents - :amount) / 100.0,
+                       paid_status = CASE WHEN remaining_cents = :amount THEN 'Paid' ELSE 'Not Paid' END
+                   WHERE invoice_id = :invoice_id AND remaining_cents >= :amount"""
+INSERT_PAYMENT = """INSERT INTO payments (invoice_id, date, amount_cents, method, note)
+                    VALUES (:invoice_id, :date, :amount, :method, :note)"""
+SELECT_BALANCE = "SELECT total_cents, paid_cents, remaining_cents FROM invoices WHERE invoice_id = ?"
+SELECT_PAYMENTS = "SELECT * FROM payments WHERE invoice_id = ? ORDER BY date, payment_id"
+SELECT_OUTSTANDING = """SELECT * FROM invoices WHERE remaining_cents > 0
+                        ORDER BY remaining_cents DESC, invoice_id DESC LIMIT ?"""
+
+METHODS = ('Cash', 'Bank Transfer', 'Card', 'Cheque')
+
+
+def balance(invoice_id, conn=None):
+    """``(total_cents, paid_cents, remaining_cents)`` of an invoice."""
+    conn = conn or db.get_connection()
+    row = conn.execute(SELECT_BALANCE, (invoice_id,)).fetchone()
+    if row is None:
+        raise LookupError(f'Invoice {invoice_id} does not exist')
+    return row
+
+
+def apply_payment(conn, invoice_id, amount_cents, date=None, method='', note=''):
+    """record_payment inside the caller's transaction."""
+    if amount_cents <= 0:
+        raise ValueError('A payment must be more than zero')
+    params = {'invoice_id': invoice_id, 'amount': amount_cents, 'date': date or Date.today().isoformat(),
+              'method': method, 'note': note}
+    if conn.execute(APPLY_PAYMENT, params).rowcount == 0:
+        remaining = balance(invoice_id, conn)[2]
+        raise ValueError(f'Payment is more than the remaining balance of {remaining / 100:.2f}')
+    payment_id = conn.execute(INSERT_PAYMENT, params).lastrowid
+    return payment_id, balance(invoice_id, conn)[2]
+
+
+def record_payment(invoice_id, amount_cents, date=None, method='', note='', conn=None):
+    """Record a payment of ``amount_cents`` against an invoice.
+
+    Raises ValueError for amounts that are not positive or are more than the
+    balance, and LookupError for an unknown invoice. Returns the new payment
+    id and the invoice's remaining balance in cents.
+    """
+    conn = conn or db.get_connection()
+    with conn:
+        return apply_payment(conn, invoice_id, amount_cents, date, method, note)
+
+
+def payments_for(invoice_id, conn=None):
+    conn = conn or db.get_connection()
+    return conn.execute(SELECT_PAYMENTS, (invoice_id,)).fetchall()
+
+
+def outstanding_invoices(limit=100, conn=None):
+    """Invoices with a balance left, largest first, read from the partial outstanding index."""
+    conn = conn or db.get_connection()
+    return conn.execute(SELECT_OUTSTANDING, (limit,)).fetchall()
@@ -0,0 +1,47 @@
+import os
+import db
+import metrics
+from layout import get_layout
+
+DUPLICATE_DIR = 'duplicate_invoices'
+INVOICE_DIR = 'invoices'
+
+
+class RenderCancelled(Exception):
+    """Raised from a progress callback to abandon a render part way through."""
+
+
+def build_invoice_pdf(invoice, items, progress=None):
+    return get_layout().render(invoice, items, progress)
+
+
+def write_invoice_pdf(invoice, items, out_dir=DUPLICATE_DIR, progress=None):
+    """Lay out and write one invoice, reporting ``progress(percent, stage)`` on the way."""
+    report = progress or (lambda percent, stage: None)
+
+    def layout_progress(done, total):
+        report(10 + 80 * done // max(total, 1), 'Laying out items')
+
+    report(10, 'Laying out')
+    with metrics.span('render.layout'):
+        pdf = build_invoice_pdf(invoice, items, layout_progress)
+
+    report(90, 'Writing PDF')
+    os.makedirs(out_dir, exist_ok=True)
+    pdf_name = os.path.join(out_dir, f"invoice_{invoice[0]}.pdf")
+    # Replaced rather than rewritten in place, since the old file may be a
+    # hard link into the render cache
+    with metrics.span('render.output'):
+        pdf.output(pdf_name + '.tmp')
+        os.replace(pdf_name + '.tmp', pdf_name)
+    report(100, 'Done')
+    return pdf_name
+
+
+def render_invoice(invoice_id, out_dir=DUPLICATE_DIR, conn=None, progress=None):
+    """Render one invoice to ``out_dir/invoice_{id}.pdf`` without touching Qt."""
+    if progress:
+        progress(0, 'Loading invoice')
+    with metrics.span('db.fetch_invoice'):
+        invoice, items = db.fetch_invoice(invoice_id, conn)
+    return write_invoice_pdf(invoice, items, out_dir, progress)
@@ -0,0 +1,141 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+import db
+import metrics
+from layout import LOGO_PATH, TEMPLATE_VERSION
+from render import DUPLICATE_DIR, write_invoice_pdf
+
+CACHE_DIR = os.environ.get('INVOICES_RENDER_CACHE', 'render_cache')
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+_logo = {}
+_logo_lock = threading.Lock()
+
+
+def _logo_digest(path=LOGO_PATH):
+    """sha256 of the logo file, re-read only when its size or mtime changes."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return ''
+    signature = (path, stat.st_size, stat.st_mtime_ns)
+    with _logo_lock:
+        if _logo.get('signature') != signature:
+            with open(path, 'rb') as f:
+                _logo['digest'] = hashlib.sha256(f.read()).hexdigest()
+            _logo['signature'] = signature
+        return _logo['digest']
+
+
+def cache_key(invoice, items):
+    """Hash of everything that ends up in an invoice's PDF."""
+    h = hashlib.sha256()
+    h.update(f"template:{TEMPLATE_VERSION}\nlogo:{_logo_digest()}\n".encode())
+    h.update(repr(tuple(invoice)).encode())
+    for item in items:
+        h.update(b'\n')
+        h.update(repr(tuple(item)).encode())
+    return h.hexdigest()
+
+
+def cache_path(key):
+    return os.path.join(CACHE_DIR, f"{key}.pdf")
+
+
+def _publish(cached, pdf_name):
+    """Make ``pdf_name`` the cached file, hard-linked when the filesystem allows."""
+    if os.path.exists(pdf_name):
+        if os.path.samefile(cached, pdf_name):
+            return
+        os.remove(pdf_name)
+    try:
+        os.link(cached, pdf_name)
+    except OSError:
+        shutil.copyfile(cached, pdf_name)
+
+
+def lookup(key, conn=None):
+    """The cached PDF for ``key``, or None. A hit counts as a use for LRU."""
+    conn = conn or db.get_connection()
+    row = conn.execute("SELECT stale FROM render_cache WHERE key = ?", (key,)).fetchone()
+    if row is None or row[0]:
+        return None
+    path = cache_path(key)
+    if not os.path.exists(path):
+        conn.execute("DELETE FROM render_cache WHERE key = ?", (key,))
+        conn.commit()
+        return None
+    conn.execute("UPDATE render_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+    conn.commit()
+    return path
+
+
+def store(key, invoice_id, path, conn=None):
+    conn = conn or db.get_connection()
+    conn.execute("""INSERT OR REPLACE INTO render_cache (key, invoice_id, size, last_used, stale)
+                    VALUES (?, ?, ?, ?, 0)""", (key, invoice_id, os.path.getsize(path), time.time()))
+    # Older renders of the same invoice can never be hit again
+    conn.execute("UPDATE render_cache SET stale = 1 WHERE invoice_id = ? AND key != ?", (invoice_id, key))
+    conn.commit()
+    evict(conn=conn)
+
+
+def invalidate(invoice_id, conn=None):
+    conn = conn or db.get_connection()
+    conn.execute("UPDATE render_cache SET stale = 1 WHERE invoice_id = ?", (invoice_id,))
+    conn.commit()
+
+
+def evict(max_bytes=MAX_CACHE_BYTES, conn=None):
+    """Delete stale entries, then least recently used ones until the cache fits ``max_bytes``."""
+    conn = conn or db.get_connection()
+    doomed = [key for key, in conn.execute("SELECT key FROM render_cache WHERE stale = 1")]
+
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM render_cache WHERE stale = 0").fetchone()[0]
+    if total > max_bytes:
+        for key, size in conn.execute("SELECT key, size FROM render_cache WHERE stale = 0 ORDER BY last_used"):
+            doomed.append(key)
+            total -= size
+            if total <= max_bytes:
+                break
+
+    for key in doomed:
+        try:
+            os.remove(cache_path(key))
+        except FileNotFoundError:
+            pass
+    conn.executemany("DELETE FROM render_cache WHERE key = ?", [(key,) for key in doomed])
+    conn.commit()
+    return len(doomed)
+
+
+def render_cached(invoice_id, out_dir=DUPLICATE_DIR, conn=None, progress=None):
+    """Like render.render_invoice, but reuses the last PDF if nothing that goes into it changed."""
+    if progress:
+        progress(0, 'Loading invoice')
+    conn = conn or db.get_connection()
+    with metrics.span('db.fetch_invoice'):
+        invoice, items = db.fetch_invoice(invoice_id, conn)
+    with metrics.span('render.cache_lookup'):
+        key = cache_key(invoice, items)
+        cached = lookup(key, conn)
+
+    os.makedirs(out_dir, exist_ok=True)
+    pdf_name = os.path.join(out_dir, f"invoice_{invoice_id}.pdf")
+    if cached is None:
+        # Rendered under a private name first so a half-written file is never cached
+        tmp_dir = os.path.join(CACHE_DIR, f"tmp-{os.getpid()}-{threading.get_ident()}")
+        rendered = write_invoice_pdf(invoice, items, tmp_dir, progress)
+        cached = cache_path(key)
+        os.replace(rendered, cached)
+        os.rmdir(tmp_dir)
+        store(key, invoice_id, cached, conn)
+    elif progress:
+        progress(100, 'Done')
+
+    _publish(cached, pdf_name)
+    return pdf_name
@@ -0,0 +1,63 @@
+import db
+
+# Every function here reads summary_totals, which triggers keep current, so
+# the cost depends on the number of customers/venues/months, never on the
+# number of invoices.
+
+SELECT_DIMENSION = """SELECT key, invoice_count, total_cents, paid_cents, remaining_cents
+                      FROM summary_totals WHERE dimension = ? AND invoice_count > 0"""
+
+
+class Totals:
+    __slots__ = ('key', 'invoice_count', 'total_cents', 'paid_cents', 'remaining_cents')
+
+    def __init__(self, key, invoice_count=0, total_cents=0, paid_cents=0, remaining_cents=0):
+        self.key = key
+        self.invoice_count = invoice_count
+        self.total_cents = total_cents
+        self.paid_cents = paid_cents
+        self.remaining_cents = remaining_cents
+
+
+def totals(dimension, order_by='key', conn=None):
+    """All Totals for one of 'customer', 'venue', 'month' or 'status'."""
+    if order_by not in Totals.__slots__:
+        raise ValueError(f'Cannot order by {order_by!r}')
+    descending = ' DESC' if order_by != 'key' else ''
+    conn = conn or db.get_connection()
+    rows = conn.execute(f"{SELECT_DIMENSION} ORDER BY {order_by}{descending}", (dimension,))
+    return [Totals(*row) for row in rows]
+
+
+def totals_for(dimension, key, conn=None):
+    conn = conn or db.get_connection()
+    row = conn.execute(f"{SELECT_DIMENSION} AND key = ?", (dimension, key)).fetchone()
+    return Totals(*row) if row else Totals(key)
+
+
+def outstanding_by_customer(conn=None):
+    return [t for t in totals('customer', 'remaining_cents', conn) if t.remaining_cents > 0]
+
+
+def customer_balance(customer_phone, conn=None):
+    return totals_for('customer', customer_phone, conn).remaining_cents
+
+
+def revenue_by_month(conn=None):
+    return totals('month', conn=conn)
+
+
+def revenue_by_venue(conn=None):
+    return totals('venue', 'total_cents', conn)
+
+
+def dashboard(conn=None):
+    """Headline numbers across all invoices."""
+    by_status = totals('status', conn=conn)
+    return {
+        'invoice_count': sum(t.invoice_count for t in by_status),
+        'total_cents': sum(t.total_cents for t in by_status),
+        'paid_cents': sum(t.paid_cents for t in by_status),
+        'outstanding_cents': sum(t.remaining_cents for t in by_status),
+        'unpaid_count': sum(t.invoice_count for t in by_status if t.key != 'Paid'),
+    }
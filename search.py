@@ -0,0 +1,189 @@
+import re
+
+import archive
+import db
+
+SEARCH_LIMIT = 500
+
+# Scoring costs about a microsecond per matching row, so words found in
+# more rows than this are listed newest first instead of by relevance
+RANK_LIMIT = 20000
+
+# Invoices matching on customer/venue or through any of their items. Each
+# index is cut to its own top hits before the join so a word found in every
+# invoice does not drag every row through it. FTS5 ranks are negative
+# (lower is better); in newest-first mode -rowid plays the same role.
+# LIMIT -1 keeps the filtered invoices a subquery of their own: with the
+# archive views as {invoices}, that is what lets SQLite look the hits up by
+# id in each archive instead of copying every archived row first. Archived
+# invoices keep their index entries, so without the archives {live_invoices}
+# and {live_items} drop them before the cut, where they would take the
+# places of live matches.
+SEARCH_INVOICES = """
+    WITH hits (invoice_id, score) AS (
+        SELECT * FROM (SELECT rowid, {score} FROM invoice_search WHERE invoice_search MATCH :query {{live_invoices}}
+                       ORDER BY {order} LIMIT :limit)
+        UNION ALL
+        SELECT invoice_items.invoice_id, item_hits.score
+        FROM (SELECT rowid, {score} AS score FROM item_search WHERE item_search MATCH :query {{live_items}}
+              ORDER BY {order} LIMIT :item_limit) AS item_hits
+        JOIN {{items}} AS invoice_items ON invoice_items.item_id = item_hits.rowid
+    ),
+    ranked AS (SELECT invoice_id, MIN(score) AS score FROM hits GROUP BY invoice_id)
+    SELECT invoices.*
+    FROM (SELECT * FROM {{invoices}} AS invoices
+          WHERE invoices.invoice_id IN (SELECT invoice_id FROM ranked) AND {{where}} LIMIT -1) AS invoices
+    JOIN ranked ON ranked.invoice_id = invoices.invoice_id
+    ORDER BY {{order_by}}
+    LIMIT :limit"""
+
+SEARCH_RANKED = SEARCH_INVOICES.format(score='rank', order='rank')
+SEARCH_RECENT = SEARCH_INVOICES.format(score='-rowid', order='rowid DESC')
+RANKED_ORDER = 'ranked.score, invoices.invoice_id DESC'
+RECENT_ORDER = 'invoices.invoice_id DESC'
+
+LIVE_INVOICES = "AND +rowid IN (SELECT invoice_id FROM main.invoices)"
+LIVE_ITEMS = "AND +rowid IN (SELECT item_id FROM main.invoice_items)"
+
+COUNT_MATCHES = """SELECT (SELECT COUNT(*) FROM (SELECT 1 FROM invoice_search WHERE invoice_search MATCH :query LIMIT :cap))
+                        + (SELECT COUNT(*) FROM (SELECT 1 FROM item_search WHERE item_search MATCH :query LIMIT :cap))"""
+
+
+# Row-at-a-time index triggers, which bulk writers replace with index_invoice_range
+INSERT_TRIGGERS = ('invoice_search_insert', 'item_search_insert')
+
+
+def index_invoice_range(first_id, last_id, conn=None):
+    """Index invoices ``first_id..last_id`` and their items in two statements.
+
+    For bulk inserts made with INSERT_TRIGGERS suspended: FTS5 flushes its
+    pending terms at every trigger statement, which makes row-by-row indexing
+    several times slower than one INSERT ... SELECT.
+    """
+    conn = conn or db.get_connection()
+    conn.execute("""INSERT INTO invoice_search (rowid, customer_name, venue)
+                    SELECT invoice_id, customer_name, venue FROM invoices WHERE invoice_id BETWEEN ? AND ?""",
+                 (first_id, last_id))
+    conn.execute("""INSERT INTO item_search (rowid, name, description)
+                    SELECT item_id, name, description FROM invoice_items WHERE invoice_id BETWEEN ? AND ?""",
+                 (first_id, last_id))
+
+
+def to_match_query(text):
+    """Turn free text into an FTS5 query where every word must match as a prefix.
+
+    Returns None when the text has no searchable words. Quoting each word keeps
+    FTS5 operators and punctuation typed by the user from being parsed.
+    """
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_invoices(text, limit=SEARCH_LIMIT, conn=None, filters=None, sort=None, descending=False):
+    """Invoices whose customer, venue or items match ``text``, best matches first.
+
+    A word has to match within one field group: the customer name and venue
+    of the invoice, or the name and description of a single item.
+    ``filters`` and ``sort`` are as for browse_invoices and apply to the
+    best matches, so a narrow filter can leave fewer than ``limit`` rows.
+    """
+    query = to_match_query(text)
+    if query is None:
+        return []
+    conn = conn or db.get_connection()
+    matches = conn.execute(COUNT_MATCHES, {'query': query, 'cap': RANK_LIMIT + 1}).fetchone()[0]
+    sql, order_by = (SEARCH_RANKED, RANKED_ORDER) if matches <= RANK_LIMIT else (SEARCH_RECENT, RECENT_ORDER)
+
+    where, params = filter_sql(filters or {})
+    if sort:
+        order_by = _order_by(sort, descending)
+    params.update(query=query, limit=limit, item_limit=limit * 4)
+    invoices, items = _tables(filters or {}, conn)
+    archived = (filters or {}).get('archived')
+    sql = sql.format(where=where, order_by=order_by, invoices=invoices, items=items,
+                     live_invoices='' if archived else LIVE_INVOICES, live_items='' if archived else LIVE_ITEMS)
+    return conn.execute(sql, params).fetchall()
+
+
+# Columns the viewer can sort on, in the order of the invoices table. Each
+# has an index, and invoice_id breaks ties so every row has a unique key.
+SORT_COLUMNS = ('invoice_id', 'date', 'venue', 'customer_name', 'customer_phone',
+                'total_amount', 'paid_amount', 'remaining_amount', 'paid_status')
+
+
+def filter_sql(filters):
+    """``(where, params)`` for a dict of viewer filters, each one answerable from an index.
+
+    Keys: date_from and date_to (inclusive, YYYY-MM-DD), status, customer
+    (a phone number prefix if it is all digits, otherwise words that must
+    prefix-match the customer name) and min_balance_cents. Parameters are named,
+    so the clause can be combined with other named-parameter SQL. The
+    archived key is not a condition; see _tables.
+    """
+    clauses = []
+    params = {}
+    if filters.get('date_from'):
+        clauses.append("invoices.date >= :date_from")
+        params['date_from'] = filters['date_from']
+    if filters.get('date_to'):
+        clauses.append("invoices.date <= :date_to")
+        params['date_to'] = filters['date_to']
+    if filters.get('status'):
+        clauses.append("invoices.paid_status = :status")
+        params['status'] = filters['status']
+    customer = (filters.get('customer') or '').strip()
+    if customer.isdigit():
+        # A range rather than LIKE so the customer_phone index is used
+        clauses.append("invoices.customer_phone >= :phone AND invoices.customer_phone < :phone_end")
+        params.update(phone=customer, phone_end=customer + '\uffff')
+    elif to_match_query(customer):
+        clauses.append("invoices.invoice_id IN (SELECT rowid FROM invoice_search WHERE invoice_search MATCH :customer)")
+        params['customer'] = f"customer_name : ({to_match_query(customer)})"
+    if filters.get('min_balance_cents'):
+        # Implies a balance above zero, which lets the partial outstanding index answer it
+        clauses.append("invoices.remaining_cents >= :min_balance AND invoices.remaining_cents > 0")
+        params['min_balance'] = filters['min_balance_cents']
+    return ' AND '.join(clauses) or '1', params
+
+
+def _tables(filters, conn):
+    """The invoice and item tables to read: the live ones, or with ``archived`` set, views that add the archives."""
+    if filters.get('archived'):
+        archive.attach_archives(conn)
+        return 'all_invoices', 'all_invoice_items'
+    return 'invoices', 'invoice_items'
+
+
+def _order_by(sort, descending):
+    if sort not in SORT_COLUMNS:
+        raise ValueError(f'Cannot sort by {sort!r}')
+    direction = ' DESC' if descending else ''
+    if sort == 'invoice_id':
+        return f"invoices.invoice_id{direction}"
+    return f"invoices.{sort}{direction}, invoices.invoice_id{direction}"
+
+
+def browse_invoices(filters=None, sort='invoice_id', descending=False, after=None, limit=256, conn=None):
+    """One page of invoices matching ``filters``, ordered by ``sort``.
+
+    Pages use keyset pagination: pass the last row of the previous page as
+    ``after`` and the next page starts right after it, an index seek however
+    deep the page is. With ``archived`` set in ``filters`` the pages include
+    archived invoices.
+    """
+    conn = conn or db.get_connection()
+    where, params = filter_sql(filters or {})
+    if after is not None:
+        compare = '<' if descending else '>'
+        if sort == 'invoice_id':
+            where += f" AND invoices.invoice_id {compare} :after_id"
+        else:
+            where += f" AND (invoices.{sort}, invoices.invoice_id) {compare} (:after_value, :after_id)"
+            params['after_value'] = after[SORT_COLUMNS.index(sort)]
+        params['after_id'] = after[0]
+    params['limit'] = limit
+    invoices, _ = _tables(filters or {}, conn)
+    sql = f"SELECT * FROM {invoices} AS invoices WHERE {where} ORDER BY {_order_by(sort, descending)} LIMIT :limit"
+    return conn.execute(sql, params).fetchall()
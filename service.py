@@ -0,0 +1,252 @@
+"""Local HTTP service that renders and creates invoices for other programs.
+
+    GET  /health               liveness and pool size
+    GET  /queue                queued, running and finished job counts
+    GET  /invoices/<id>.pdf    render (or reuse) an invoice and stream the PDF
+    POST /invoices             create an invoice from JSON and stream its PDF
+
+POST takes the same record bulk_import reads from JSONL: date, venue,
+customer_name, customer_phone, paid_amount and a list of items with name,
+description, price and quantity. Renders run in a process pool fed from a
+bounded queue; when the queue is full requests get 503 with Retry-After
+instead of piling up. There is no authentication, so the service only
+listens on this machine.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import db
+import metrics
+from db import DB_PATH
+from render import DUPLICATE_DIR, INVOICE_DIR
+from writer import Writer, _is_loopback
+
+HOST = '127.0.0.1'
+PORT = 8765
+QUEUE_SIZE = 64
+MAX_BODY = 1024 * 1024
+CHUNK = 64 * 1024
+
+INVOICE_PDF = re.compile(r'^/invoices/(\d+)\.pdf$')
+
+REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+def _init_worker(db_path):
+    db.DB_PATH = db_path
+
+
+def _render(invoice_id, out_dir):
+    # Runs in a pool process, on that process's own connection
+    from render_cache import render_cached
+
+    return render_cached(invoice_id, out_dir)
+
+
+def _validate(record):
+    from bulk_import import validate
+
+    return validate(record)
+
+
+class RenderService:
+    def __init__(self, db_path=DB_PATH, workers=None, queue_size=QUEUE_SIZE):
+        self.db_path = db_path
+        self.workers = workers or os.cpu_count() or 1
+        self.queue = asyncio.Queue(queue_size)
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.pool = None
+        self.dispatchers = []
+        # Concurrent POSTs are committed together instead of queueing on the write lock
+        self.writer = Writer(db_path)
+
+    async def start(self):
+        # Migrate once here so pool processes never race to do it
+        db.get_connection(self.db_path)
+        # Workers start on the first renders, while client sockets are open;
+        # plain fork would let them inherit those sockets and hold them open
+        context = multiprocessing.get_context('forkserver' if os.name == 'posix' else 'spawn')
+        self.pool = ProcessPoolExecutor(self.workers, mp_context=context,
+                                        initializer=_init_worker, initargs=(self.db_path,))
+        self.dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+        self.writer.start()
+
+    async def stop(self):
+        for task in self.dispatchers:
+            task.cancel()
+        self.pool.shutdown(cancel_futures=True)
+        self.writer.stop()
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            invoice_id, out_dir, future = await self.queue.get()
+            if future.cancelled():
+                continue
+            self.running += 1
+            try:
+                with metrics.span('service.render'):
+                    path = await loop.run_in_executor(self.pool, _render, invoice_id, out_dir)
+            except Exception as e:
+                self.failed += 1
+                if not future.cancelled():
+                    future.set_exception(e)
+            else:
+                self.completed += 1
+                if not future.cancelled():
+                    future.set_result(path)
+            finally:
+                self.running -= 1
+
+    async def render(self, invoice_id, out_dir=DUPLICATE_DIR):
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((invoice_id, out_dir, future))
+        except asyncio.QueueFull:
+            raise HTTPError(503, 'Render queue is full', {'Retry-After': '1'})
+        return await future
+
+    def stats(self):
+        return {'queued': self.queue.qsize(), 'queue_size': self.queue.maxsize, 'running': self.running,
+                'workers': self.workers, 'completed': self.completed, 'failed': self.failed}
+
+    async def handle(self, reader, writer):
+        try:
+            try:
+                method, path, body = await self._read_request(reader)
+                with metrics.span('service.request'):
+                    await self._route(method, path, body, writer)
+            except HTTPError as e:
+                await self._send_json(writer, e.status, {'error': str(e)}, e.headers)
+            except Exception as e:
+                await self._send_json(writer, 500, {'error': f"{type(e).__name__}: {e}"})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method, path, body, writer):
+        match = INVOICE_PDF.match(path)
+        if path == '/health':
+            await self._send_json(writer, 200, {'status': 'ok', 'workers': self.workers})
+        elif path == '/queue':
+            await self._send_json(writer, 200, self.stats())
+        elif match and method == 'GET':
+            invoice_id = int(match.group(1))
+            try:
+                pdf = await self.render(invoice_id)
+            except LookupError as e:
+                raise HTTPError(404, str(e))
+            await self._send_file(writer, 200, pdf, {'X-Invoice-Id': str(invoice_id)})
+        elif path == '/invoices' and method == 'POST':
+            # Refuse before writing anything rather than create an invoice that cannot be rendered now
+            if self.queue.full():
+                raise HTTPError(503, 'Render queue is full', {'Retry-After': '1'})
+            try:
+                invoice, items = _validate(json.loads(body))
+            except (KeyError, TypeError, ValueError, AttributeError) as e:
+                raise HTTPError(400, f"Invalid invoice: {e}")
+            row, _ = await asyncio.wrap_future(self.writer.submit('insert_invoice', *invoice, items))
+            invoice_id = row[0]
+            pdf = await self.render(invoice_id, INVOICE_DIR)
+            await self._send_file(writer, 201, pdf, {'X-Invoice-Id': str(invoice_id),
+                                                      'Location': f'/invoices/{invoice_id}.pdf'})
+        elif match or path == '/invoices':
+            raise HTTPError(405, f'{method} not allowed on {path}')
+        else:
+            raise HTTPError(404, f'No such endpoint: {path}')
+
+    async def _read_request(self, reader):
+        request_line = (await reader.readline()).decode('latin-1').split()
+        if len(request_line) != 3:
+            raise HTTPError(400, 'Malformed request line')
+        method, path, _ = request_line
+
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            raise HTTPError(400, 'Malformed Content-Length')
+        if length < 0:
+            raise HTTPError(400, 'Malformed Content-Length')
+        if length > MAX_BODY:
+            raise HTTPError(413, f'Request body over {MAX_BODY} bytes')
+        body = await reader.readexactly(length) if length else b''
+        return method.upper(), path.split('?', 1)[0], body
+
+    async def _send_head(self, writer, status, content_type, length, headers=None):
+        lines = [f'HTTP/1.1 {status} {REASONS[status]}', f'Content-Type: {content_type}',
+                 f'Content-Length: {length}', 'Connection: close']
+        lines += [f'{name}: {value}' for name, value in (headers or {}).items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+
+    async def _send_json(self, writer, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        await self._send_head(writer, status, 'application/json', len(body), headers)
+        writer.write(body)
+        await writer.drain()
+
+    async def _send_file(self, writer, status, path, headers=None):
+        with open(path, 'rb') as f:
+            await self._send_head(writer, status, 'application/pdf', os.fstat(f.fileno()).st_size, headers)
+            while chunk := f.read(CHUNK):
+                writer.write(chunk)
+                await writer.drain()
+
+
+async def serve(host=HOST, port=PORT, db_path=DB_PATH, workers=None, queue_size=QUEUE_SIZE):
+    """Serve until cancelled. Raises ValueError for a host other machines can reach."""
+    if not _is_loopback(host):
+        raise ValueError(f'Refusing to listen on {host}: the service has no authentication, use a local address')
+    service = RenderService(db_path, workers, queue_size)
+    await service.start()
+    server = await asyncio.start_server(service.handle, host, port)
+    print(f"Serving invoices from {db_path} on http://{host}:{port} with {service.workers} render processes")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve invoice PDFs to local programs over HTTP.')
+    parser.add_argument('--host', default=HOST, help='local address to listen on')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--db', default=DB_PATH, help='path to invoices.db')
+    parser.add_argument('--workers', type=int, help='render processes (default: CPU count)')
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE, help='renders waiting before 503s')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.db, args.workers, args.queue_size))
+    except ValueError as e:
+        parser.error(str(e))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
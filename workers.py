@@ -0,0 +1,173 @@
+import itertools
+import threading
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+import metrics
+from render import DUPLICATE_DIR, RenderCancelled, write_invoice_pdf
+from render_cache import render_cached
+
+
+class RenderSignals(QObject):
+    progress = pyqtSignal(int, int, str)
+    finished = pyqtSignal(int, str)
+    failed = pyqtSignal(int, str)
+    cancelled = pyqtSignal(int)
+
+
+class RenderJob(QRunnable):
+    """Renders one invoice on a pool thread.
+
+    Pass ``invoice`` and ``items`` when the caller already has the rows, as
+    right after a save; otherwise they are read on the worker thread and
+    the render cache is tried first.
+    """
+
+    def __init__(self, job_id, invoice_id, out_dir=DUPLICATE_DIR, invoice=None, items=None):
+        super().__init__()
+        self.job_id = job_id
+        self.invoice_id = invoice_id
+        self.out_dir = out_dir
+        self.invoice = invoice
+        self.items = items
+        self.signals = RenderSignals()
+        self.cancel_event = threading.Event()
+
+    def _progress(self, percent, stage):
+        # Checked at every progress step so a cancel lands mid-render
+        if self.cancel_event.is_set():
+            raise RenderCancelled()
+        self.signals.progress.emit(self.job_id, percent, stage)
+
+    def run(self):
+        try:
+            with metrics.profiled(), metrics.span('render.job'):
+                self._progress(0, 'Starting')
+                if self.invoice is None:
+                    pdf_name = render_cached(self.invoice_id, self.out_dir, progress=self._progress)
+                else:
+                    pdf_name = write_invoice_pdf(self.invoice, self.items, self.out_dir, progress=self._progress)
+        except RenderCancelled:
+            self.signals.cancelled.emit(self.job_id)
+        except Exception as e:
+            self.signals.failed.emit(self.job_id, f"{type(e).__name__}: {e}")
+        else:
+            self.signals.finished.emit(self.job_id, pdf_name)
+
+
+class RenderQueue(QObject):
+    """Queues invoice renders on a thread pool and relays their signals.
+
+    Every signal carries the job id returned by submit().
+    """
+    progress = pyqtSignal(int, int, str)
+    finished = pyqtSignal(int, str)
+    failed = pyqtSignal(int, str)
+    cancelled = pyqtSignal(int)
+    pendingChanged = pyqtSignal(int)
+
+    # PDF layout holds the GIL, so more threads would not render faster;
+    # two keep a long invoice from blocking the next one entirely
+    MAX_THREADS = 2
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(self.MAX_THREADS)
+        self.jobs = {}
+        self._ids = itertools.count(1)
+
+    def submit(self, invoice_id, out_dir=DUPLICATE_DIR, invoice=None, items=None):
+        job = RenderJob(next(self._ids), invoice_id, out_dir, invoice, items)
+        job.signals.progress.connect(self.progress)
+        job.signals.finished.connect(self._on_finished)
+        job.signals.failed.connect(self._on_failed)
+        job.signals.cancelled.connect(self._on_cancelled)
+        # Only the cancel flag is kept: the pool owns and deletes the job
+        self.jobs[job.job_id] = job.cancel_event
+        self.pool.start(job)
+        self.pendingChanged.emit(len(self.jobs))
+        return job.job_id
+
+    def cancel(self, job_id):
+        """Cancel a job; one that has not started yet gives up as soon as it does."""
+        cancel_event = self.jobs.get(job_id)
+        if cancel_event is not None:
+            cancel_event.set()
+
+    def cancel_all(self):
+        for job_id in list(self.jobs):
+            self.cancel(job_id)
+
+    def wait(self, msecs=-1):
+        return self.pool.waitForDone(msecs)
+
+    def _done(self, job_id):
+        self.jobs.pop(job_id, None)
+        self.pendingChanged.emit(len(self.jobs))
+
+    def _on_finished(self, job_id, pdf_name):
+        self._done(job_id)
+        self.finished.emit(job_id, pdf_name)
+
+    def _on_failed(self, job_id, error):
+        self._done(job_id)
+        self.failed.emit(job_id, error)
+
+    def _on_cancelled(self, job_id):
+        self._done(job_id)
+        self.cancelled.emit(job_id)
+
+
+class LookupSignals(QObject):
+    finished = pyqtSignal(int, object)
+
+
+class LookupJob(QRunnable):
+    def __init__(self, job_id, function, args):
+        super().__init__()
+        self.job_id = job_id
+        self.function = function
+        self.args = args
+        self.signals = LookupSignals()
+
+    def run(self):
+        try:
+            result = self.function(*self.args)
+        except Exception:
+            # A failed suggestion lookup only means no suggestions
+            result = None
+        self.signals.finished.emit(self.job_id, result)
+
+
+class LookupQueue(QObject):
+    """Runs quick database lookups off the GUI thread, newest first.
+
+    Each submit() drops lookups still waiting to start, and ``finished``
+    fires only with the result of the latest one, so typing never shows
+    suggestions for text that has since changed. A lookup that raised
+    reports None.
+    """
+    finished = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.latest = 0
+        self._ids = itertools.count(1)
+
+    def submit(self, function, *args):
+        job = LookupJob(next(self._ids), function, args)
+        job.signals.finished.connect(self._on_finished)
+        self.latest = job.job_id
+        self.pool.clear()
+        self.pool.start(job)
+        return job.job_id
+
+    def wait(self, msecs=-1):
+        return self.pool.waitForDone(msecs)
+
+    def _on_finished(self, job_id, result):
+        if job_id == self.latest:
+            self.finished.emit(result)
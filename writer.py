@@ -0,0 +1,424 @@
+"""One writer for invoices.db, shared by every window, thread and front desk.
+
+SQLite lets one connection write at a time. When every instance opens its
+own write transaction they queue on the lock, each paying for a commit,
+and past busy_timeout saves fail with ``database is locked``. Writes here
+go through a Writer instead: a thread with its own connection that takes
+whatever has queued up while the last commit ran and commits it as one
+transaction (group commit), retrying with backoff when another process
+holds the lock. Each write runs under a savepoint, so one that fails, like
+an overpayment, does not take the rest of its batch down with it.
+
+Instances on other machines reach a single Writer over the network:
+
+    INVOICES_WRITER_KEY=secret python -m cli writer --listen 0.0.0.0:6543         # on one machine
+    INVOICES_WRITER_KEY=secret INVOICES_WRITER=that-host:6543 python main.py      # on the others
+
+Clients must prove they know INVOICES_WRITER_KEY before anything else is
+read, within HANDSHAKE_TIMEOUT seconds, and the writer refuses to listen
+beyond this machine without one.
+Requests and replies are plain JSON, never pickles, so a client can only
+ask for the writes listed in OPERATIONS.
+
+get_writer() returns a WriterClient when INVOICES_WRITER is set and an
+in-process Writer otherwise; both have the same insert_invoice and
+record_payment methods, which return what db.insert_invoice and
+payments.record_payment do. Both give up with TimeoutError after
+WRITE_TIMEOUT seconds; a write that timed out may still have been saved.
+"""
+import argparse
+import concurrent.futures
+import ipaddress
+import json
+import os
+import queue
+import random
+import socket
+import sqlite3
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Connection, answer_challenge, deliver_challenge
+
+import db
+import metrics
+import payments
+from db import DB_PATH
+
+BATCH_SIZE = 128
+RETRIES = 8
+BACKOFF = 0.02
+MAX_BACKOFF = 1.0
+PORT = 6543
+CONNECT_TIMEOUT = 5
+# How long a new connection may take to prove it knows the key
+HANDSHAKE_TIMEOUT = 5
+WRITE_TIMEOUT = 30
+# Shared secret for the listener; set INVOICES_WRITER_KEY on every machine.
+# The default only guards against stray connections on this machine.
+DEFAULT_AUTHKEY = b'invoices'
+AUTHKEY = os.environ.get('INVOICES_WRITER_KEY', '').encode() or DEFAULT_AUTHKEY
+# Errors a listener passes back to its client, by name; anything else
+# arrives as a sqlite3.DatabaseError carrying the original name
+REMOTE_ERRORS = {
+    'ValueError': ValueError,
+    'LookupError': LookupError,
+    'IntegrityError': sqlite3.IntegrityError,
+    'OperationalError': sqlite3.OperationalError,
+    'DatabaseError': sqlite3.DatabaseError,
+    'Error': sqlite3.Error,
+}
+
+
+def _insert_invoice(conn, date, venue, customer_name, customer_phone, total_amount, paid_amount,
+                    remaining_amount, paid_status, items):
+    return db.add_invoice(conn, (date, venue, customer_name, customer_phone, total_amount, paid_amount,
+                                 remaining_amount, paid_status), items)
+
+
+OPERATIONS = {
+    'insert_invoice': _insert_invoice,
+    'record_payment': payments.apply_payment,
+}
+
+
+def _result(future):
+    try:
+        return future.result(timeout=WRITE_TIMEOUT)
+    except concurrent.futures.TimeoutError:
+        raise TimeoutError(f'The writer did not answer within {WRITE_TIMEOUT}s; the write may still be saved')
+
+
+def _is_busy(error):
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in str(error) or 'busy' in str(error))
+
+
+class Writer(threading.Thread):
+    """Applies queued writes in batches on one connection; see the module docstring."""
+
+    def __init__(self, db_path=None, batch_size=BATCH_SIZE):
+        super().__init__(name='invoice-writer', daemon=True)
+        self.db_path = db_path or DB_PATH
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.writes = 0
+        self._stopping = False
+        # Set once run() has ended, after which every write fails with it
+        self._closed = None
+        self._closed_lock = threading.Lock()
+
+    def submit(self, operation, *args):
+        """Queue a write and return a Future for its result."""
+        if operation not in OPERATIONS:
+            raise ValueError(f'Unknown write {operation!r}')
+        future = Future()
+        with self._closed_lock:
+            if self._closed is not None:
+                future.set_exception(self._closed)
+            else:
+                self.queue.put((operation, args, future))
+        return future
+
+    def insert_invoice(self, *args):
+        return _result(self.submit('insert_invoice', *args))
+
+    def record_payment(self, invoice_id, amount_cents, date=None, method='', note=''):
+        return _result(self.submit('record_payment', invoice_id, amount_cents, date, method, note))
+
+    def stop(self):
+        self.queue.put(None)
+        self.join()
+
+    def run(self):
+        try:
+            conn = db.connect(self.db_path)
+        except Exception as e:
+            self._close(e)
+            return
+        try:
+            while True:
+                batch = self._next_batch()
+                if batch:
+                    self._commit(conn, batch)
+                if self._stopping:
+                    break
+        except Exception as e:
+            self._close(e)
+            raise
+        finally:
+            conn.close()
+            self._close(sqlite3.OperationalError('The writer has stopped'))
+
+    def _close(self, error):
+        # Fail whatever is still queued so no caller waits on a dead thread
+        with self._closed_lock:
+            if self._closed is None:
+                self._closed = error
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None and item[2].set_running_or_notify_cancel():
+                item[2].set_exception(self._closed)
+
+    def _next_batch(self):
+        # Block for the first write, then take whatever else is already
+        # waiting: batches grow with load without delaying a lone save
+        batch = []
+        item = self.queue.get()
+        while item is not None:
+            if item[2].set_running_or_notify_cancel():
+                batch.append(item)
+            if len(batch) >= self.batch_size:
+                return batch
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                return batch
+        self._stopping = True
+        return batch
+
+    def _commit(self, conn, batch):
+        for attempt in range(RETRIES):
+            try:
+                with metrics.span('writer.batch'):
+                    results = self._apply(conn, batch)
+                break
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.rollback()
+                if not _is_busy(e) or attempt == RETRIES - 1:
+                    for _, _, future in batch:
+                        future.set_exception(e)
+                    return
+                time.sleep(min(MAX_BACKOFF, BACKOFF * 2 ** attempt) * random.uniform(0.5, 1.5))
+
+        self.batches += 1
+        self.writes += len(batch)
+        for (_, _, future), (ok, result) in zip(batch, results):
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(result)
+
+    def _apply(self, conn, batch):
+        conn.execute("BEGIN IMMEDIATE")
+        results = []
+        for operation, args, _ in batch:
+            conn.execute("SAVEPOINT write")
+            try:
+                results.append((True, OPERATIONS[operation](conn, *args)))
+            except Exception as e:
+                if _is_busy(e):
+                    raise
+                conn.execute("ROLLBACK TO write")
+                results.append((False, e))
+            conn.execute("RELEASE write")
+        conn.commit()
+        return results
+
+
+def _set_io_timeout(sock, seconds):
+    # Connection reads and writes the raw descriptor, which ignores
+    # socket.settimeout(); the kernel's send and receive timeouts still
+    # apply, failing a stalled call with OSError. None waits forever.
+    if sys.platform == 'win32':
+        value = int((seconds or 0) * 1000)
+    else:
+        value = struct.pack('ll', int(seconds or 0), int((seconds or 0) % 1 * 1_000_000))
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, value)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, value)
+
+
+def _send(connection, message):
+    connection.send_bytes(json.dumps(message).encode())
+
+
+def _recv(connection):
+    return json.loads(connection.recv_bytes(1 << 20))
+
+
+def _error_reply(error):
+    name = next((cls.__name__ for cls in type(error).__mro__ if cls.__name__ in REMOTE_ERRORS),
+                type(error).__name__)
+    return [False, name, str(error)]
+
+
+class WriterClient:
+    """Sends writes to a Writer served by serve() on another machine or process."""
+
+    def __init__(self, address, authkey=AUTHKEY):
+        self.address = address
+        self.authkey = authkey
+        self.connection = None
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        # What multiprocessing.connection.Client does, with timeouts: a writer
+        # that stops answering mid-handshake or mid-write raises OSError
+        sock = socket.create_connection(self.address, timeout=CONNECT_TIMEOUT)
+        sock.setblocking(True)
+        _set_io_timeout(sock, CONNECT_TIMEOUT)
+        connection = Connection(sock.detach())
+        try:
+            answer_challenge(connection, self.authkey)
+            deliver_challenge(connection, self.authkey)
+            # Replies are waited for with poll(WRITE_TIMEOUT); this bounds a
+            # send or a reply that stops halfway
+            sock = socket.socket(fileno=connection.fileno())
+            try:
+                _set_io_timeout(sock, WRITE_TIMEOUT)
+            finally:
+                sock.detach()
+        except Exception:
+            connection.close()
+            raise
+        return connection
+
+    def call(self, operation, *args):
+        with self.lock:
+            # Nothing is ever sent unasked, so a readable idle connection
+            # means the writer has gone away (restarted) since the last call.
+            # Only reconnecting before the send is safe: a reply lost after
+            # it may belong to a write that was committed.
+            if self.connection is not None and self.connection.poll():
+                self.close()
+            if self.connection is None:
+                self.connection = self._connect()
+            try:
+                _send(self.connection, [operation, args])
+                if not self.connection.poll(WRITE_TIMEOUT):
+                    raise TimeoutError(f'The writer did not answer within {WRITE_TIMEOUT}s; '
+                                       f'the write may still be saved')
+                reply = _recv(self.connection)
+            except (OSError, EOFError, ValueError):
+                self.close()
+                raise
+        if not reply[0]:
+            _, name, message = reply
+            if name in REMOTE_ERRORS:
+                raise REMOTE_ERRORS[name](message)
+            raise sqlite3.DatabaseError(f'{name}: {message}')
+        return reply[1]
+
+    def insert_invoice(self, *args):
+        invoice, rows = self.call('insert_invoice', *args)
+        return tuple(invoice), [tuple(row) for row in rows]
+
+    def record_payment(self, invoice_id, amount_cents, date=None, method='', note=''):
+        return tuple(self.call('record_payment', invoice_id, amount_cents, date, method, note))
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def _serve_connection(sock, writer, authkey):
+    # The handshake runs here rather than in the accept loop, so a client
+    # that connects and never answers holds up only its own thread
+    _set_io_timeout(sock, HANDSHAKE_TIMEOUT)
+    connection = Connection(sock.detach())
+    with connection:
+        try:
+            deliver_challenge(connection, authkey)
+            answer_challenge(connection, authkey)
+        except (OSError, EOFError, AuthenticationError):
+            return
+        sock = socket.socket(fileno=connection.fileno())
+        try:
+            # Idle clients may wait any time between writes
+            _set_io_timeout(sock, None)
+        finally:
+            sock.detach()
+        while True:
+            try:
+                operation, args = _recv(connection)
+            except (OSError, EOFError, ValueError, TypeError):
+                return
+            try:
+                if not isinstance(operation, str) or not isinstance(args, list):
+                    raise ValueError('Malformed request')
+                reply = [True, writer.submit(operation, *args).result()]
+            except Exception as e:
+                reply = _error_reply(e)
+            try:
+                _send(connection, reply)
+            except OSError:
+                return
+
+
+def _is_loopback(host):
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+
+def serve(address, db_path=None, authkey=AUTHKEY):
+    """Accept WriterClient connections on ``address`` and apply their writes with one Writer.
+
+    Raises ValueError for an address other machines can reach while the
+    key is still the default.
+    """
+    if authkey == DEFAULT_AUTHKEY and not _is_loopback(address[0]):
+        raise ValueError(f'Set INVOICES_WRITER_KEY to a shared secret before listening on {address[0]}')
+    writer = Writer(db_path)
+    writer.start()
+    # A backlog of 1 leaves front desks starting together waiting on TCP retries
+    with socket.create_server(address, backlog=64) as server:
+        print(f"Writing to {writer.db_path} for clients on {address[0]}:{address[1]}")
+        while True:
+            try:
+                sock, _ = server.accept()
+            except OSError:
+                continue
+            threading.Thread(target=_serve_connection, args=(sock, writer, authkey), daemon=True).start()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def parse_address(text):
+    host, _, port = text.rpartition(':')
+    return host or '127.0.0.1', int(port or PORT)
+
+
+def get_writer(db_path=None):
+    """The process's writer: a WriterClient if INVOICES_WRITER names one, else a local Writer thread."""
+    global _writer
+    with _writer_lock:
+        # A local writer that could not open the database is replaced, so
+        # the next save tries again
+        if _writer is None or (isinstance(_writer, Writer) and not _writer.is_alive()):
+            if os.environ.get('INVOICES_WRITER'):
+                _writer = WriterClient(parse_address(os.environ['INVOICES_WRITER']))
+            else:
+                _writer = Writer(db_path)
+                _writer.start()
+        return _writer
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve invoice and payment writes to other app instances.')
+    parser.add_argument('--listen', default=f'127.0.0.1:{PORT}',
+                        help='host:port to accept clients on; use 0.0.0.0 to serve other machines')
+    parser.add_argument('--db', default=DB_PATH, help='path to invoices.db')
+    args = parser.parse_args(argv)
+    try:
+        serve(parse_address(args.listen), args.db)
+    except ValueError as e:
+        parser.error(str(e))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())